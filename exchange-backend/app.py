@@ -2,6 +2,8 @@ from flask import Flask
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
+import tempfile
+from pathlib import Path
 
 
 #from db_config import DB_CONFIG
@@ -15,15 +17,34 @@ DB_NAME = os.getenv("DB_NAME")
 
 app = Flask(__name__)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = f'mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+#DATABASE_URI replaces the whole url (e.g. the sqlite file the benchmarks in bench/ run against)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URI", f'mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}')
 app.config['SECRET_KEY']= os.getenv("SECRET_KEY")
+#rate limit counters are shared by all the workers of this host through a sqlite file (see service/limiter_storage.py),
+#otherwise "5 per minute" would really be 5 per minute per worker. as_posix so the default is also a valid url on windows
+#(sqlite:///C:/Users/.../Temp/exchange-ratelimit.db)
+app.config['RATELIMIT_STORAGE_URI'] = os.getenv("RATELIMIT_STORAGE_URI", "sqlite:///" + Path(tempfile.gettempdir(), "exchange-ratelimit.db").as_posix())
+app.config['RATELIMIT_STRATEGY'] = os.getenv("RATELIMIT_STRATEGY", "sliding-window-counter")
 
 from extensions import db, ma, bcrypt, limiter
+import service.limiter_storage#registers the sqlite:// storage scheme before the limiter reads RATELIMIT_STORAGE_URI
 db.init_app(app)
 ma.init_app(app)
 bcrypt.init_app(app)
 limiter.init_app(app)
-CORS(app)
+CORS(app, expose_headers=['X-Next-Cursor'])#lets the frontend read the cursor of the next page
+
+from service.auth_service import token_cache, principal_cache
+token_cache.init_app(app)#also registers the hook that reads the caller's token before each request
+principal_cache.init_app(app)
+from service.password_service import password_hasher
+password_hasher.init_app(app)
+from service.response_cache import response_cache
+response_cache.init_app(app)
+from service.alert_worker import alert_worker
+alert_worker.init_app(app)
+from service.audit_service import audit_sink
+audit_sink.init_app(app)
 
 #get the blueprint objects defined in the route files and plug them into the app
 from route.auth_route import auth_bp
@@ -50,6 +71,11 @@ app.register_blueprint(audit_bp)
 app.register_blueprint(notifications_bp)
 app.register_blueprint(reports_bp)
 app.register_blueprint(backup_bp)
+
+from service.rollup_service import rebuild_rollups_command
+app.cli.add_command(rebuild_rollups_command)
+from service.counter_service import rebuild_counters_command
+app.cli.add_command(rebuild_counters_command)
     
 if __name__ == "__main__":
     app.run(debug=False)
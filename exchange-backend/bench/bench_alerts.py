@@ -0,0 +1,44 @@
+#time of one alert evaluation (check_and_notify) as the number of alerts grows. almost all the alerts are armed on the
+#far side of the current rate and only TRIGGERED of them cross it, so the time should follow the triggered alerts and
+#not the total
+import random
+from sqlalchemy import insert
+from common import app, db, register, timed
+from model.alert import Alert
+from model.transaction import Transaction
+from service.notification_service import check_and_notify
+
+SIZES = [1000, 10000, 50000]
+TRIGGERED = 10
+RATE = 90000
+REPEAT = 20
+
+def seed_alerts(count):
+    rows = []
+    for i in range(count):
+        direction = random.choice(['above', 'below'])
+        #far from the rate, so these never fire
+        threshold = RATE * random.uniform(1.05, 1.5) if direction == 'above' else RATE * random.uniform(0.5, 0.95)
+        rows.append({"user_id": 1, "usd_to_lbp": True, "threshold": threshold, "direction": direction,
+                     "state": 'armed', "rearm_margin": 0})
+    db.session.execute(insert(Alert), rows)
+    db.session.commit()
+
+def evaluate():
+    check_and_notify(db.session)
+    db.session.rollback()  #keep the triggered alerts armed for the next round
+
+if __name__ == '__main__':
+    register('bench')  #user 1, owner of every alert
+    with app.app_context():
+        #inserted directly and not through POST /transaction, so the background alert worker doesnt fire our alerts
+        db.session.add(Transaction(1, RATE, True, None))
+        for _ in range(TRIGGERED):
+            db.session.add(Alert(1, True, RATE * 0.9, 'above'))
+        db.session.commit()
+        total = 0
+        for size in SIZES:
+            seed_alerts(size - total)
+            total = size
+            timed(evaluate, 3)  #warm up
+            print(f"{size:>6} alerts ({TRIGGERED} triggered): {timed(evaluate, REPEAT) * 1000:.2f} ms per evaluation")
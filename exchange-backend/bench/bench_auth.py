@@ -0,0 +1,27 @@
+#auth overhead per request: verifying the token (HS256 + json) against a token cache hit, and a whole GET /me with the
+#token cache emptied before every call against one that keeps it
+from common import client, register, timed
+from service.auth_service import token_cache, decode_token
+
+REPEAT = 20000
+REQUESTS = 2000
+
+def uncached(fn):
+    def call():
+        token_cache.clear()
+        fn()
+    return call
+
+if __name__ == '__main__':
+    headers = register('bench')
+    token = headers['Authorization'].split()[1]
+
+    verify = timed(uncached(lambda: decode_token(token)), REPEAT)
+    decode_token(token)
+    hit = timed(lambda: decode_token(token), REPEAT)
+    print(f"decode_token: {verify * 1e6:.1f} us verified, {hit * 1e6:.1f} us from the cache")
+
+    me = lambda: client.get('/me', headers=headers)
+    cold = timed(uncached(me), REQUESTS)
+    warm = timed(me, REQUESTS)
+    print(f"GET /me: {cold * 1e6:.0f} us with a verify on every request, {warm * 1e6:.0f} us with the cache")
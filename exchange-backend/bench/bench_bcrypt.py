@@ -0,0 +1,34 @@
+#logins per second through POST /authentication at several bcrypt costs, with CLIENTS concurrent clients and the
+#default pool of BCRYPT_WORKERS hashing threads
+import threading
+import time
+from common import app, client
+from service.password_service import password_hasher
+
+CLIENTS = 8
+LOGINS = {4: 400, 8: 80, 10: 24, 12: 8}  #logins per cost, fewer for the slow ones
+
+def login_burst(user_name, count):
+    per_client = count // CLIENTS
+
+    def login():
+        with app.test_client() as thread_client:
+            for _ in range(per_client):
+                response = thread_client.post('/authentication', json={'user_name': user_name, 'password': 'pw'})
+                assert response.status_code == 200, response.status_code
+
+    threads = [threading.Thread(target=login) for _ in range(CLIENTS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return per_client * CLIENTS / (time.perf_counter() - start)
+
+if __name__ == '__main__':
+    print(f"{CLIENTS} clients, {password_hasher.workers} bcrypt workers")
+    for cost, count in LOGINS.items():
+        password_hasher.log_rounds = cost
+        user_name = f'cost{cost}'
+        client.post('/user', json={'user_name': user_name, 'password': 'pw'})  #hashed at this cost, so no rehash on login
+        print(f"cost {cost:>2}: {login_burst(user_name, count):.1f} logins/s")
@@ -0,0 +1,36 @@
+#commits per request on the trade and offer write paths, counted with an engine "commit" listener. only the commits
+#made on the request's own thread count: the audit sink and the alert worker commit later from their own threads, off
+#the request
+import threading
+from collections import Counter
+from sqlalchemy import event
+from common import app, db, client, register
+
+REQUESTS = 20
+
+commits = Counter()  #"request" or "background" -> number of commits
+
+def count_commit(connection):
+    commits["request" if threading.get_ident() == threading.main_thread().ident else "background"] += 1
+
+def commits_per_request(send):
+    commits.clear()
+    for _ in range(REQUESTS):
+        response = send()
+        assert response.status_code in (200, 201), (response.status_code, response.json)
+    return commits["request"] / REQUESTS
+
+if __name__ == '__main__':
+    seller = register('seller')
+    buyer = register('buyer')
+    with app.app_context():
+        event.listen(db.engine, 'commit', count_commit)
+
+    transaction = lambda: client.post('/transaction', json={'usd_amount': 1, 'lbp_amount': 90000, 'usd_to_lbp': True},
+                                      headers=seller)
+    print(f"POST /transaction: {commits_per_request(transaction):.1f} commits per request")
+
+    offer_ids = iter([client.post('/market/offers', json={'usd_amount': 10, 'lbp_amount': 900000, 'usd_to_lbp': True},
+                                  headers=seller).json['id'] for _ in range(REQUESTS)])
+    accept = lambda: client.post(f'/market/offers/{next(offer_ids)}/accept', headers=buyer)
+    print(f"POST /market/offers/<id>/accept: {commits_per_request(accept):.1f} commits per request")
@@ -0,0 +1,45 @@
+#rate limiter checks per second on the sqlite storage, through the same limits strategies flask-limiter uses, and a
+#check that PROCESSES processes sharing the file never grant more than the limit between them. doesnt need the app
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import service.limiter_storage  #registers the sqlite:// scheme
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter, SlidingWindowCounterRateLimiter
+
+URI = "sqlite:///" + Path(tempfile.gettempdir(), "exchange-bench-ratelimit.db").as_posix()
+CHECKS = 5000
+KEYS = 50  #distinct callers
+PROCESSES = 4
+ATTEMPTS = 60  #per process, against a limit of 100
+
+def checks_per_second(strategy):
+    limit = parse("1000000 per minute")  #never reached, we time the check itself
+    start = time.perf_counter()
+    for i in range(CHECKS):
+        strategy.hit(limit, f"caller{i % KEYS}")
+    return CHECKS / (time.perf_counter() - start)
+
+def attempt(_):
+    limiter = SlidingWindowCounterRateLimiter(storage_from_string(URI))
+    limit = parse("100 per minute")
+    return sum(limiter.hit(limit, "shared") for _ in range(ATTEMPTS))
+
+if __name__ == '__main__':
+    storage = storage_from_string(URI)
+    storage.reset()
+    print(f"sliding-window-counter: {checks_per_second(SlidingWindowCounterRateLimiter(storage)):.0f} checks/s")
+    print(f"fixed-window: {checks_per_second(FixedWindowRateLimiter(storage)):.0f} checks/s")
+
+    storage.reset()
+    with multiprocessing.Pool(PROCESSES) as pool:
+        granted = sum(pool.map(attempt, range(PROCESSES)))
+    print(f"{PROCESSES} processes x {ATTEMPTS} attempts against a limit of 100: {granted} granted")
+    if granted != 100:
+        sys.exit(1)
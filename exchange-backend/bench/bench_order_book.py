@@ -0,0 +1,58 @@
+#order book throughput: matches per second from memory (find_match + remove, what auto_match does before touching the
+#db), the time of a depth snapshot, the cost of the full rebuild (first use) and of the incremental sync that runs
+#every sync_interval, and matches per second end to end through POST /market/offers with auto_match. the book keeps
+#its real sync interval everywhere, so the syncs that fall inside the timed loops are counted
+import datetime
+import random
+import time
+from sqlalchemy import insert
+from common import app, db, client, register, timed
+from model.offer import Offer
+from service.order_book import order_book
+
+RESTING = 20000
+MATCHES = 5000
+HTTP_MATCHES = 1000  #long enough to span a few syncs
+CHANGED = 100  #offers written by "other workers" before the timed sync
+
+def seed_asks(count, user_id, written_at):
+    #resting usd_to_lbp offers (asks) of 100 USD between 89000 and 91000 LBP/USD
+    rows = [{"user_id": user_id, "usd_amount": 100.0, "lbp_amount": 100 * random.uniform(89000, 91000),
+             "usd_to_lbp": True, "status": 'available', "creation_date": written_at, "updated_at": written_at}
+            for _ in range(count)]
+    db.session.execute(insert(Offer), rows)
+    db.session.commit()
+
+if __name__ == '__main__':
+    register('seller')  #user 1, owner of the resting offers
+    buyer = register('buyer')  #user 2
+    with app.app_context():
+        #an established book: written long before the sync slack, so syncs only read what changed since
+        seed_asks(RESTING, 1, datetime.datetime.now() - datetime.timedelta(hours=1))
+        start = time.perf_counter()
+        order_book.rebuild()
+        print(f"full rebuild of {RESTING} offers (first use only): {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        start = time.perf_counter()
+        for _ in range(MATCHES):
+            match_id = order_book.find_match(False, 100.0, 100 * 92000, 2)  #a bid above every ask
+            order_book.remove(match_id)
+        print(f"in memory: {MATCHES / (time.perf_counter() - start):.0f} matches/s")
+        print(f"snapshot (depth 10): {timed(lambda: order_book.snapshot(10), 200) * 1e6:.0f} us")
+
+        seed_asks(CHANGED, 1, datetime.datetime.now())
+        start = time.perf_counter()
+        order_book._sync(datetime.datetime.now())
+        print(f"incremental sync ({CHANGED} offers written since the last one, once every "
+              f"{order_book.sync_interval.seconds}s): {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        #the timed matches above were never written to the db, start the endpoint run from the real table
+        order_book.reset()
+        order_book.rebuild()
+    start = time.perf_counter()
+    for _ in range(HTTP_MATCHES):
+        response = client.post('/market/offers', json={'usd_amount': 100, 'lbp_amount': 100 * 92000, 'usd_to_lbp': False,
+                                                        'auto_match': True}, headers=buyer)
+        assert response.json['matched_offer'] is not None
+    elapsed = time.perf_counter() - start
+    print(f"POST /market/offers with auto_match: {HTTP_MATCHES / elapsed:.0f} matches/s over {elapsed:.1f}s")
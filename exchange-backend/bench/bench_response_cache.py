@@ -0,0 +1,46 @@
+#the public rate endpoints on a database seeded with TRANSACTIONS transactions over the last 72 hours: a cache miss
+#(version bumped before every call), a cache hit, and a 304 for a client that sends back the ETag
+import datetime
+import random
+from sqlalchemy import insert
+from common import app, db, client, register, timed
+from model.transaction import Transaction
+from service.response_cache import response_cache
+from service.rollup_service import rebuild_rollups
+from service.counter_service import rebuild_rate_counters
+
+TRANSACTIONS = 20000
+REPEAT = 200
+PATHS = ['/exchangeRate', '/analytics', '/exchangeRateHistory?interval=hourly']
+
+def seed_transactions(count):
+    now = datetime.datetime.now()
+    window = 72 * 60 * 60
+    rows = [{"usd_amount": 1.0, "lbp_amount": random.uniform(89000, 91000), "usd_to_lbp": i % 2 == 0, "user_id": 1,
+             "added_date": now - datetime.timedelta(seconds=random.uniform(0, window)), "source": 'internal',
+             "is_outlier": False} for i in range(count)]
+    db.session.execute(insert(Transaction), rows)
+    #what add_transaction keeps up to date for every insert
+    rebuild_rollups(db.session)
+    rebuild_rate_counters(db.session)
+    db.session.commit()
+
+def miss(path):
+    def call():
+        response_cache.bump()
+        client.get(path)
+    return call
+
+if __name__ == '__main__':
+    register('bench')  #user 1, owner of the transactions
+    with app.app_context():
+        seed_transactions(TRANSACTIONS)
+    print(f"{TRANSACTIONS} transactions")
+    for path in PATHS:
+        miss(path)()  #warm up (the rate engine loads its window on the first read)
+        cold = timed(miss(path), REPEAT // 10)
+        etag = client.get(path).headers['ETag']  #the cached body, the timestamps in it dont change until it expires
+        warm = timed(lambda: client.get(path), REPEAT)
+        not_modified = timed(lambda: client.get(path, headers={'If-None-Match': etag}), REPEAT)
+        print(f"{path}: miss {cold * 1000:.2f} ms, hit {warm * 1000:.2f} ms, 304 {not_modified * 1000:.2f} ms")
+    print(response_cache.stats())
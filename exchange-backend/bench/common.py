@@ -0,0 +1,53 @@
+#shared setup of the benchmark scripts (run them from exchange-backend/, e.g. python bench/bench_alerts.py).
+#the app runs against a throwaway sqlite file unless DATABASE_URI is set (point it at a scratch mysql database to get
+#numbers closer to production), with the rate limiter off so we measure the code and not the limits
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+BENCH_DB = os.path.join(tempfile.gettempdir(), "exchange-bench.db")
+if "DATABASE_URI" not in os.environ:
+    if os.path.exists(BENCH_DB):
+        os.remove(BENCH_DB)
+    os.environ["DATABASE_URI"] = "sqlite:///" + Path(BENCH_DB).as_posix()
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+
+import importlib
+import pkgutil
+from app import app
+from extensions import db, limiter
+from service.password_service import password_hasher
+import model
+
+limiter.enabled = False
+password_hasher.log_rounds = 4  #cheap hashes for the users we create, bench_bcrypt sets its own costs
+
+with app.app_context():
+    for module in pkgutil.iter_modules(model.__path__):
+        importlib.import_module('model.' + module.name)
+    db.create_all()
+
+client = app.test_client()
+
+def register(name, admin=False):
+    #creates a user and returns the headers to call the api as them
+    client.post('/user', json={'user_name': name, 'password': 'pw'})
+    if admin:
+        from model.user import User
+        with app.app_context():
+            User.query.filter_by(user_name=name).update({"role": 'ADMIN'})
+            db.session.commit()
+    response = client.post('/authentication', json={'user_name': name, 'password': 'pw'})
+    return {'Authorization': 'Bearer ' + response.json['token']}
+
+def timed(fn, repeat):
+    #seconds per call of fn, over `repeat` calls
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
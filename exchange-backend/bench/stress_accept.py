@@ -0,0 +1,49 @@
+#concurrent acceptance: THREADS users race to accept each of OFFERS offers at the same time. every offer must have
+#exactly one 200 and the other requests a 409 (the conditional UPDATE lets only one of them change the row). exits
+#with status 1 if that doesnt hold, and prints the accept throughput under contention
+import sys
+import threading
+import time
+from collections import Counter
+from common import app, client, register
+
+THREADS = 8
+OFFERS = 20
+
+def race(offer_ids, users):
+    results = []  #(offer_id, status code)
+    lock = threading.Lock()
+    barrier = threading.Barrier(len(users))
+
+    def accept_all(headers):
+        with app.test_client() as thread_client:
+            barrier.wait()  #every thread starts on the first offer together
+            for offer_id in offer_ids:
+                status = thread_client.post(f'/market/offers/{offer_id}/accept', headers=headers).status_code
+                with lock:
+                    results.append((offer_id, status))
+
+    threads = [threading.Thread(target=accept_all, args=(headers,)) for headers in users]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start
+
+if __name__ == '__main__':
+    seller = register('seller')
+    users = [register(f'buyer{i}') for i in range(THREADS)]
+    offer_ids = [client.post('/market/offers', json={'usd_amount': 10, 'lbp_amount': 900000, 'usd_to_lbp': True},
+                             headers=seller).json['id'] for _ in range(OFFERS)]
+
+    results, elapsed = race(offer_ids, users)
+    winners = Counter(offer_id for offer_id, status in results if status == 200)
+    statuses = Counter(status for _, status in results)
+    print(f"{len(results)} accepts in {elapsed:.2f}s ({len(results) / elapsed:.0f} requests/s), status codes: {dict(statuses)}")
+
+    failed = [offer_id for offer_id in offer_ids if winners[offer_id] != 1]
+    if failed or set(statuses) - {200, 409}:
+        print(f"FAILED: offers without exactly one winner: {failed}")
+        sys.exit(1)
+    print(f"ok: exactly one winner for each of the {OFFERS} offers")
@@ -9,14 +9,24 @@ class Alert(db.Model):
     threshold = db.Column(db.Float, nullable=False)
     direction = db.Column(db.String(5), nullable=False)  # above or below threshold
     creation_date = db.Column(db.DateTime)
+    state = db.Column(db.String(10), nullable=False, default='armed')  #armed (waiting for a crossing) or fired
+    last_rate = db.Column(db.Float, nullable=True)  #rate at the last evaluation that changed the state
+    rearm_margin = db.Column(db.Float, nullable=False, default=0)  #how far back the rate must go before the alert can fire again
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now)  #set on every write (fired, re-armed...)
 
-    def __init__(self, user_id, usd_to_lbp, threshold, direction):
+    #lets check_and_notify fetch only the alerts that change state with a range query on the threshold
+    __table_args__ = (db.Index('ix_alert_pair_state_threshold', 'usd_to_lbp', 'direction', 'state', 'threshold'),)
+
+    def __init__(self, user_id, usd_to_lbp, threshold, direction, rearm_margin=0):
         super(Alert, self).__init__(
             user_id=user_id,
             usd_to_lbp=usd_to_lbp,
             threshold=threshold,
             direction=direction,
             creation_date=datetime.datetime.now(),
+            state='armed',
+            last_rate=None,
+            rearm_margin=rearm_margin
         )
 
 class AlertSchema(ma.Schema):
@@ -26,6 +36,10 @@ class AlertSchema(ma.Schema):
     threshold = fields.Float()
     direction = fields.Str()
     creation_date = fields.DateTime()
+    state = fields.Str()
+    last_rate = fields.Float(allow_none=True)
+    rearm_margin = fields.Float()
+    updated_at = fields.DateTime(allow_none=True)
 
 alert_schema=AlertSchema()
 alerts_schema=AlertSchema(many=True)
\ No newline at end of file
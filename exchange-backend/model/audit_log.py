@@ -9,6 +9,12 @@ class AuditLog(db.Model):
     description = db.Column(db.String(255), nullable=False)
     timestamp = db.Column(db.DateTime)
 
+    #for the paged (newest first) log lists
+    __table_args__ = (
+        db.Index('ix_audit_log_timestamp', 'timestamp', 'id'),
+        db.Index('ix_audit_log_user_timestamp', 'user_id', 'timestamp', 'id'),
+    )
+
     def __init__(self, event_type, description, user_id=None, ip_address=None):
         super(AuditLog, self).__init__(
             event_type=event_type,
@@ -8,13 +8,19 @@ class BackupRecord(db.Model):
     timestamp = db.Column(db.DateTime)
     status = db.Column(db.String(10), nullable=False)  #succeeeded  or failed
     record_counts = db.Column(db.String(255), nullable=False)  # JSON string of counts
+    backup_type = db.Column(db.String(12), nullable=False, default='full')  # full or incremental
+    base_backup_id = db.Column(db.Integer, db.ForeignKey('backup_record.id'), nullable=True)  # the backup an incremental one continues from
+    high_water_marks = db.Column(db.Text, nullable=True)  # JSON string: start time and max id of every table when the backup started
 
-    def __init__(self, triggered_by, status, record_counts):
+    def __init__(self, triggered_by, status, record_counts, backup_type='full', base_backup_id=None, high_water_marks=None):
         super(BackupRecord, self).__init__(
             triggered_by=triggered_by,
             timestamp=datetime.datetime.now(),
             status=status,
-            record_counts=record_counts
+            record_counts=record_counts,
+            backup_type=backup_type,
+            base_backup_id=base_backup_id,
+            high_water_marks=high_water_marks
         )
 
 class BackupRecordSchema(ma.Schema):
@@ -23,6 +29,9 @@ class BackupRecordSchema(ma.Schema):
     timestamp = fields.DateTime()
     status = fields.Str()
     record_counts = fields.Str()
+    backup_type = fields.Str()
+    base_backup_id = fields.Int(allow_none=True)
+    high_water_marks = fields.Str(allow_none=True)
 
 backup_record_schema = BackupRecordSchema()
 backup_records_schema = BackupRecordSchema(many=True)
\ No newline at end of file
@@ -9,6 +9,10 @@ class Notification(db.Model):
     message = db.Column(db.String(255), nullable=False)
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now)  #set on every write (marked as read...)
+
+    #for the paged (newest first) notification list of a user
+    __table_args__ = (db.Index('ix_notification_user_created', 'user_id', 'created_at', 'id'),)
 
     def __init__(self, user_id, title, message):
         super(Notification, self).__init__(
@@ -26,6 +30,7 @@ class NotificationSchema(ma.Schema):
     message = fields.Str()
     is_read = fields.Bool()
     created_at = fields.DateTime()
+    updated_at = fields.DateTime(allow_none=True)
 
 notification_schema = NotificationSchema()
 notifications_schema = NotificationSchema(many=True)
\ No newline at end of file
@@ -12,6 +12,15 @@ class Offer(db.Model):
     creation_date=db.Column(db.DateTime)
     accepted_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     accepted_at = db.Column(db.DateTime, nullable=True)
+    #set on every write (accept, cancel...), so an incremental backup sees the row changed
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now)
+
+    #for the paged (newest first) list of available offers
+    #and for the order book, which picks up the offers written since its last sync
+    __table_args__ = (
+        db.Index('ix_offer_status_created', 'status', 'creation_date', 'id'),
+        db.Index('ix_offer_updated', 'updated_at')
+    )
 
     def __init__(self, user_id, usd_amount, lbp_amount, usd_to_lbp):
         super(Offer, self).__init__(
@@ -35,6 +44,7 @@ class OfferSchema(ma.Schema):
     creation_date = fields.DateTime()
     accepted_by = fields.Int(allow_none=True)
     accepted_at = fields.DateTime(allow_none=True)
+    updated_at = fields.DateTime(allow_none=True)
 
 offer_schema= OfferSchema()
 offers_schema= OfferSchema(many=True)
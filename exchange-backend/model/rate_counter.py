@@ -0,0 +1,23 @@
+from extensions import db, ma
+from marshmallow import fields
+
+class RateCounter(db.Model):
+    #all-time count and sum of rates per direction, kept up to date on every insert so the admin stats dont scan the table
+    usd_to_lbp = db.Column(db.Boolean, primary_key=True, autoincrement=False)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    rate_sum = db.Column(db.Double, nullable=False, default=0)  #double: a float (single precision on mysql) drifts after a few thousand rates
+
+    def __init__(self, usd_to_lbp, transaction_count=0, rate_sum=0):
+        super(RateCounter, self).__init__(
+            usd_to_lbp=usd_to_lbp,
+            transaction_count=transaction_count,
+            rate_sum=rate_sum
+        )
+
+class RateCounterSchema(ma.Schema):
+    usd_to_lbp = fields.Bool()
+    transaction_count = fields.Int()
+    rate_sum = fields.Float()
+
+rate_counter_schema = RateCounterSchema()
+rate_counters_schema = RateCounterSchema(many=True)
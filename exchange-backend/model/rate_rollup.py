@@ -0,0 +1,49 @@
+from extensions import db, ma
+from marshmallow import fields
+
+class RateRollup(db.Model):
+    #one row per (direction, granularity, bucket), pre-aggregated so the history endpoint doesnt scan raw transactions
+    id = db.Column(db.Integer, primary_key=True)
+    usd_to_lbp = db.Column(db.Boolean, nullable=False)
+    granularity = db.Column(db.String(10), nullable=False)  #hourly or daily
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    rate_sum = db.Column(db.Double, nullable=False, default=0)  #double: a float (single precision on mysql) drifts on big buckets
+    open_rate = db.Column(db.Float, nullable=False)
+    high_rate = db.Column(db.Float, nullable=False)
+    low_rate = db.Column(db.Float, nullable=False)
+    close_rate = db.Column(db.Float, nullable=False)
+    first_date = db.Column(db.DateTime, nullable=False)  #dates of the open/close transactions, so a late insert cant overwrite them
+    last_date = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('usd_to_lbp', 'granularity', 'bucket_start', name='uq_rate_rollup_bucket'),)
+
+    def __init__(self, usd_to_lbp, granularity, bucket_start, rate, added_date):
+        super(RateRollup, self).__init__(
+            usd_to_lbp=usd_to_lbp,
+            granularity=granularity,
+            bucket_start=bucket_start,
+            transaction_count=1,
+            rate_sum=rate,
+            open_rate=rate,
+            high_rate=rate,
+            low_rate=rate,
+            close_rate=rate,
+            first_date=added_date,
+            last_date=added_date
+        )
+
+class RateRollupSchema(ma.Schema):
+    id = fields.Int()
+    usd_to_lbp = fields.Bool()
+    granularity = fields.Str()
+    bucket_start = fields.DateTime()
+    transaction_count = fields.Int()
+    rate_sum = fields.Float()
+    open_rate = fields.Float()
+    high_rate = fields.Float()
+    low_rate = fields.Float()
+    close_rate = fields.Float()
+
+rate_rollup_schema = RateRollupSchema()
+rate_rollups_schema = RateRollupSchema(many=True)
@@ -13,6 +13,13 @@ class Transaction(db.Model):
     source = db.Column(db.String(20), nullable=False, default='internal')  #internal or external
     is_outlier = db.Column(db.Boolean, default=False)
 
+    #lets the range queries of analytics/history and the paged history of a user use an index instead of scanning the whole table
+    __table_args__ = (
+        db.Index('ix_transaction_direction_date', 'usd_to_lbp', 'added_date'),
+        db.Index('ix_transaction_user_date', 'user_id', 'added_date', 'id'),
+        db.Index('ix_transaction_outlier_date', 'is_outlier', 'added_date', 'id'),#outlier review page and trend
+    )
+
     def __init__(self, usd_amount, lbp_amount, usd_to_lbp, user_id, source='internal'):
         super(Transaction, self).__init__(
             usd_amount=usd_amount,
@@ -1,5 +1,7 @@
-from extensions import db, ma, bcrypt
+from extensions import db, ma
+from service.password_service import hash_password
 from marshmallow import fields
+import datetime
 
 class User(db.Model):
     #the below is a format that is compatible with the new ma.Schema version
@@ -8,9 +10,10 @@ class User(db.Model):
     hashed_password = db.Column(db.String(128))
     role = db.Column(db.String(10), nullable=False, default='USER')# role: regular user or admin
     status = db.Column(db.String(10), nullable=False, default='active')#usr satatus: active(normal), suspended, or banned
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now)#set on every write (role/status changes...)
     def __init__ (self, user_name, password, role='USER'):
         super(User, self).__init__(user_name=user_name, role=role, status='active')
-        self.hashed_password = bcrypt.generate_password_hash(password)
+        self.hashed_password = hash_password(password)
 
 class UserSchema (ma.Schema):
     #class Meta:
@@ -22,6 +25,7 @@ class UserSchema (ma.Schema):
     user_name = fields.Str()
     role = fields.Str()
     status = fields.Str()
+    updated_at = fields.DateTime(allow_none=True)
     
 user_schema= UserSchema()
 users_schema = UserSchema(many=True)
\ No newline at end of file
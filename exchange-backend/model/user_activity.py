@@ -0,0 +1,40 @@
+from extensions import db, ma
+from marshmallow import fields
+
+class UserActivity(db.Model):
+    #per user activity counters, updated on every transaction/offer so the activity report reads a few rows from an
+    #index instead of grouping the whole transaction and offer tables
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True, autoincrement=False)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    offers_posted = db.Column(db.Integer, nullable=False, default=0)
+    offers_accepted = db.Column(db.Integer, nullable=False, default=0)  #offers of other users this user traded with
+    usd_volume = db.Column(db.Double, nullable=False, default=0)  #sum of usd_amount of the user's transactions (double, see rate_counter)
+    last_active_at = db.Column(db.DateTime)
+
+    #top-K by transactions / by offers, and the "active since" filter
+    __table_args__ = (
+        db.Index('ix_user_activity_transactions', 'transaction_count', 'user_id'),
+        db.Index('ix_user_activity_offers', 'offers_posted', 'user_id'),
+        db.Index('ix_user_activity_last_active', 'last_active_at'),
+    )
+
+    def __init__(self, user_id, transaction_count=0, offers_posted=0, offers_accepted=0, usd_volume=0, last_active_at=None):
+        super(UserActivity, self).__init__(
+            user_id=user_id,
+            transaction_count=transaction_count,
+            offers_posted=offers_posted,
+            offers_accepted=offers_accepted,
+            usd_volume=usd_volume,
+            last_active_at=last_active_at
+        )
+
+class UserActivitySchema(ma.Schema):
+    user_id = fields.Int()
+    transaction_count = fields.Int()
+    offers_posted = fields.Int()
+    offers_accepted = fields.Int()
+    usd_volume = fields.Float()
+    last_active_at = fields.DateTime()
+
+user_activity_schema = UserActivitySchema()
+user_activities_schema = UserActivitySchema(many=True)
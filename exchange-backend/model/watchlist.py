@@ -10,6 +10,9 @@ class WatchlistItem(db.Model):
     target_rate = db.Column(db.Float, nullable=True)
     created_at = db.Column(db.DateTime)
 
+    #for the paged (newest first) watchlist of a user
+    __table_args__ = (db.Index('ix_watchlist_item_user_created', 'user_id', 'created_at', 'id'),)
+
     def __init__(self, user_id, label, usd_to_lbp, target_rate=None):
         super(WatchlistItem, self).__init__(
             user_id=user_id,
@@ -1,72 +1,84 @@
-from flask import Blueprint, request, jsonify, abort
-import jwt
+from flask import Blueprint, request, jsonify
 import datetime
+import time
 from extensions import db
 from model.user import User, user_schema, users_schema
 from model.transaction import Transaction
-from service.auth_service import extract_auth_token, decode_token
+from service.auth_service import require_admin, principal_cache
+from service.rate_engine import rate_engine
+from service.counter_service import aggregate_rate_counters
+from model.rate_counter import RateCounter
+from service.response_cache import response_cache
+from service.pagination import paginate, paginated_response
 from model.preference import Preference, preference_schema
 from model.alert import Alert, alert_schema, alerts_schema
 
 admin_bp=Blueprint('admin', __name__)
 
-def get_current_user():
-    token = extract_auth_token(request)
-    if not token:
-        abort(401)
-    try:
-        return decode_token(token)
-    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-        abort(401)
-
-def require_admin():
-    user_id = get_current_user()
-    user = User.query.get(user_id)
-    if not user or user.role != 'ADMIN':
-        abort(403)
-    return user
-
 #view all users with their basic info as an admin
 @admin_bp.route('/admin/users', methods=['GET'])
 def get_all_users():
     require_admin()
-    users = User.query.all()
-    return jsonify(users_schema.dump(users))
+    #users have no timestamp, so they are paged by id only (newest first)
+    users, next_cursor = paginate(User.query, User.id)
+    return paginated_response(users_schema.dump(users), next_cursor)
+
+#how long (in seconds) /admin/stats reuses the user count on this worker: a COUNT(*) of the user table reads the whole
+#index, and the admin page doesnt need it to the second
+USER_COUNT_TTL = 60
+_user_count = [None, 0]  #count, expires_at
+
+def _total_users():
+    now = time.time()
+    if _user_count[0] is None or _user_count[1] <= now:
+        _user_count[:] = [User.query.count(), now + USER_COUNT_TTL]
+    return _user_count[0]
+
+def _recent_transactions():
+    #transactions in last 72 hours (the time window we are usually taking), straight from the db
+    end_date = datetime.datetime.now()
+    start_date = end_date - datetime.timedelta(hours=72)
+    return Transaction.query.filter(Transaction.added_date.between(start_date, end_date)).count()
 
 #view system wide transaction stats
 @admin_bp.route('/admin/stats', methods=['GET'])
 def get_system_stats():
     require_admin()
-
-    total_transactions = Transaction.query.count()
-    total_users = User.query.count()
-
-    # transactions in last 72 hours (the time window we are usually taking) (can easily change by changing hours=72 below)
-    end_date = datetime.datetime.now()
-    start_date = end_date - datetime.timedelta(hours=72)
-    recent_transactions = Transaction.query.filter(
-        Transaction.added_date.between(start_date, end_date)
-    ).count()
-
-    #computing average rates as usual
-    usd_to_lbp_transactions = Transaction.query.filter_by(usd_to_lbp=True).all()
-    lbp_to_usd_transactions = Transaction.query.filter_by(usd_to_lbp=False).all()
-
-    avg_usd_to_lbp = None
-    if usd_to_lbp_transactions:
-        avg_usd_to_lbp = sum([txn.lbp_amount / txn.usd_amount for txn in usd_to_lbp_transactions]) / len(usd_to_lbp_transactions)
-
-    avg_lbp_to_usd = None
-    if lbp_to_usd_transactions:
-        avg_lbp_to_usd = sum([txn.lbp_amount / txn.usd_amount for txn in lbp_to_usd_transactions]) / len(lbp_to_usd_transactions)
-
-    return jsonify({
-        "total_users": total_users,
-        "total_transactions": total_transactions,
-        "transactions_last_72h": recent_transactions,
-        "overall_avg_usd_to_lbp_rate": round(avg_usd_to_lbp, 4) if avg_usd_to_lbp else None,
-        "overall_avg_lbp_to_usd_rate": round(avg_lbp_to_usd, 4) if avg_lbp_to_usd else None
-    })
+    verify = request.args.get('verify', 'false').lower() == 'true'#also recompute the totals from the transaction table
+
+    #no table scan here: the all-time count and sum of rates per direction come from the counters table (one row per
+    #direction), the last 72h count from the rate engine's window (kept in memory), the user count from a short cache
+    totals = {counter.usd_to_lbp: (counter.transaction_count, counter.rate_sum) for counter in RateCounter.query.all()}
+    stats = _overall_stats(totals)
+    stats["total_users"] = _total_users()
+    stats["transactions_last_72h"] = rate_engine.window_count()
+
+    if verify:
+        #same numbers with sql aggregates over the tables, the response uses these and says if the counters agree
+        verified = _overall_stats(aggregate_rate_counters(db.session))
+        stats["counters_match"] = all(stats[key] == value for key, value in verified.items())
+        stats.update(verified)
+        stats["total_users"] = User.query.count()
+        stats["transactions_last_72h"] = _recent_transactions()
+    return jsonify(stats)
+
+def _overall_stats(totals):
+    #totals: usd_to_lbp -> (transaction count, sum of rates)
+    averages = {}
+    for usd_to_lbp in [True, False]:
+        count, rate_sum = totals.get(usd_to_lbp, (0, 0.0))
+        averages[usd_to_lbp] = round(rate_sum / count, 4) if count else None
+    return {
+        "total_transactions": sum(count for count, _ in totals.values()),
+        "overall_avg_usd_to_lbp_rate": averages[True],
+        "overall_avg_lbp_to_usd_rate": averages[False]
+    }
+
+#hit/miss counters of the cached rate endpoints (/exchangeRate, /analytics, /exchangeRateHistory) on this worker
+@admin_bp.route('/admin/cache/stats', methods=['GET'])
+def get_cache_stats():
+    require_admin()
+    return jsonify(response_cache.stats())
 
 #suspend or ban a user
 @admin_bp.route('/admin/users/<int:user_id>/status', methods=['PUT'])
@@ -83,6 +95,7 @@ def update_user_status(user_id):
 
     user.status = new_status
     db.session.commit()
+    principal_cache.invalidate(user_id)#takes effect on this worker right away, on the others within PRINCIPAL_CACHE_TTL
     return jsonify({
         "message": f"User status updated to '{new_status}'",
         "user": user_schema.dump(user)
@@ -103,6 +116,7 @@ def update_user_role(user_id):
 
     user.role = new_role
     db.session.commit()
+    principal_cache.invalidate(user_id)
     return jsonify({
         "message": f"User role updated to '{new_role}'",
         "user": user_schema.dump(user)
@@ -202,6 +216,7 @@ def create_user_alert(user_id):
     usd_to_lbp = request.json.get('usd_to_lbp')
     threshold = request.json.get('threshold')
     direction = request.json.get('direction')
+    rearm_margin = request.json.get('rearm_margin', 0)
 
     if usd_to_lbp is None or threshold is None or direction is None:
         return jsonify({"error": "usd_to_lbp, threshold, and direction are required"}), 400
@@ -209,12 +224,15 @@ def create_user_alert(user_id):
         return jsonify({"error": "Threshold must be positive"}), 400
     if direction not in ['above', 'below']:
         return jsonify({"error": "Direction must be 'above' or 'below'"}), 400
+    if float(rearm_margin) < 0:
+        return jsonify({"error": "rearm_margin can't be negative"}), 400
 
     alert = Alert(
         user_id=user_id,
         usd_to_lbp=bool(usd_to_lbp),
         threshold=float(threshold),
-        direction=direction
+        direction=direction,
+        rearm_margin=float(rearm_margin)
     )
     db.session.add(alert)
     db.session.commit()
@@ -228,26 +246,7 @@ def check_user_alerts(user_id):
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    end_date = datetime.datetime.now()
-    start_date = end_date - datetime.timedelta(hours=72)
-
-    usd_to_lbp_transactions = Transaction.query.filter(
-        Transaction.added_date.between(start_date, end_date),
-        Transaction.usd_to_lbp == True
-    ).all()
-
-    lbp_to_usd_transactions = Transaction.query.filter(
-        Transaction.added_date.between(start_date, end_date),
-        Transaction.usd_to_lbp == False
-    ).all()
-
-    avg_usd_to_lbp = None
-    if usd_to_lbp_transactions:
-        avg_usd_to_lbp = sum(t.lbp_amount / t.usd_amount for t in usd_to_lbp_transactions) / len(usd_to_lbp_transactions)
-
-    avg_lbp_to_usd = None
-    if lbp_to_usd_transactions:
-        avg_lbp_to_usd = sum(t.lbp_amount / t.usd_amount for t in lbp_to_usd_transactions) / len(lbp_to_usd_transactions)
+    avg_usd_to_lbp, avg_lbp_to_usd = rate_engine.rates(include_outliers=True)
 
     user_alerts = Alert.query.filter_by(user_id=user_id).all()
     triggered = []
@@ -1,23 +1,12 @@
-from flask import Blueprint, request, jsonify, abort
-import jwt
-import datetime
+from flask import Blueprint, request, jsonify
 from extensions import db
 from model.alert import Alert, alert_schema, alerts_schema
-from model.transaction import Transaction
-from service.auth_service import extract_auth_token, decode_token
+from service.auth_service import get_current_user
+from service.rate_engine import rate_engine
 from service.audit_service import log_event
 
 alerts_bp=Blueprint('alerts', __name__)
 
-def get_current_user():
-    token = extract_auth_token(request)
-    if not token:
-        abort(401)
-    try:
-        return decode_token(token)
-    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-        abort(401)
-
 #create new alert
 @alerts_bp.route('/alerts', methods=['POST'])
 def create_alert():
@@ -25,6 +14,7 @@ def create_alert():
     usd_to_lbp=request.json.get('usd_to_lbp')
     threshold= request.json.get('threshold')
     direction=request.json.get('direction')
+    rearm_margin=request.json.get('rearm_margin', 0)#optional hysteresis: how far back the rate must go before the alert can fire again
 
     if usd_to_lbp is None or threshold is None or direction is None:
         return jsonify({"error": "usd_to_lbp, threshold, and direction are required"}), 400
@@ -34,12 +24,15 @@ def create_alert():
         return jsonify({"error": "Direction must be 'above' or 'below'"}), 400
     if usd_to_lbp not in [True, False]:
         return jsonify({"error": "usd_to_lbp must be a boolean"}), 400
+    if float(rearm_margin) < 0:
+        return jsonify({"error": "rearm_margin can't be negative"}), 400
     
     alert= Alert(
         user_id=user_id,
         usd_to_lbp=bool(usd_to_lbp),
         threshold=float(threshold),
-        direction=direction
+        direction=direction,
+        rearm_margin=float(rearm_margin)
     )
     db.session.add(alert)
     db.session.commit()
@@ -76,26 +69,7 @@ def check_alerts():
     user_id=get_current_user()
     
     #first get current exchange rate (average of last 72 hours, as we are ususally taking it) (same logic as "get exchange rate")
-    end_date = datetime.datetime.now()
-    start_date = end_date - datetime.timedelta(hours=72)
-    
-    usd_to_lbp_transactions = Transaction.query.filter(
-        Transaction.added_date.between(start_date, end_date),
-        Transaction.usd_to_lbp == True
-    ).all()
-
-    lbp_to_usd_transactions = Transaction.query.filter(
-        Transaction.added_date.between(start_date, end_date),
-        Transaction.usd_to_lbp == False
-    ).all()
-
-    avg_usd_to_lbp = None
-    if usd_to_lbp_transactions:
-        avg_usd_to_lbp = sum([txn.lbp_amount / txn.usd_amount for txn in usd_to_lbp_transactions]) / len(usd_to_lbp_transactions)
-
-    avg_lbp_to_usd = None
-    if lbp_to_usd_transactions:
-        avg_lbp_to_usd = sum([txn.lbp_amount / txn.usd_amount for txn in lbp_to_usd_transactions]) / len(lbp_to_usd_transactions)
+    avg_usd_to_lbp, avg_lbp_to_usd = rate_engine.rates(include_outliers=True)
 
     user_alerts=Alert.query.filter_by(user_id=user_id).all()
     triggered=[]
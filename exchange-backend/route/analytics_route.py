@@ -1,11 +1,17 @@
 from flask import Blueprint, request, jsonify
 import datetime
-from model.transaction import Transaction
+from sqlalchemy import func
+from extensions import db
 from model.transaction import Transaction, transactions_schema
+from model.rate_rollup import RateRollup
+from service.rollup_service import get_bucket
+from service.response_cache import response_cache
+from service.pagination import paginate, paginated_response
 
 analytics_bp= Blueprint('analytics', __name__)
 
 @analytics_bp.route('/analytics', methods=['GET'])
+@response_cache.cached
 def get_analytics():
     start_str= request.args.get('start_date')
     end_str= request.args.get('end_date')
@@ -26,25 +32,31 @@ def get_analytics():
     if start_date >= end_date:
         return jsonify({"error": "start_date must be before end_date"}), 400
     
-    #get the transactions between the wanted dates
-    transactions = Transaction.query.filter(
+    #compute the stats in the db instead of loading every transaction of the range into python
+    rate = Transaction.lbp_amount / Transaction.usd_amount
+    range_filter = (
         Transaction.added_date.between(start_date, end_date),
         Transaction.usd_to_lbp == usd_to_lbp
-    ).all()
-
-    if not transactions:
+    )
+    stats = db.session.query(
+        func.count(Transaction.id).label('count'),
+        func.avg(rate).label('avg_rate'),
+        func.min(rate).label('min_rate'),
+        func.max(rate).label('max_rate')
+    ).filter(*range_filter).one()
+
+    if not stats.count:
         return jsonify({"message": "No transactions found for the given time range", "data": None}), 200
-    
-    #calc rate fr each transac
-    rates = []
-    for txn in transactions:
-        rates.append(txn.lbp_amount / txn.usd_amount)
-
-    avg_rate = sum(rates) / len(rates)
-    min_rate = min(rates)
-    max_rate = max(rates)
-    first_rate = rates[0]
-    last_rate = rates[-1]
+
+    #first and last rate of the range, each one is a single ordered LIMIT 1 lookup
+    first_rate = db.session.query(rate).filter(*range_filter).order_by(Transaction.added_date.asc(), Transaction.id.asc()).limit(1).scalar()
+    last_rate = db.session.query(rate).filter(*range_filter).order_by(Transaction.added_date.desc(), Transaction.id.desc()).limit(1).scalar()
+
+    avg_rate = float(stats.avg_rate)
+    min_rate = float(stats.min_rate)
+    max_rate = float(stats.max_rate)
+    first_rate = float(first_rate)
+    last_rate = float(last_rate)
     percentage_change = ((last_rate - first_rate) / first_rate) * 100
     #in addition to the stats mentioned in the assignment, I calc the volatility: according to equals money: Exchange rate volatility refers to the frequency and magnitude of fluctuations in a currency pair's value over a specific period (basically how stable the exch rate is)
     volatility = (max_rate - min_rate) / avg_rate * 100
@@ -53,7 +65,7 @@ def get_analytics():
         "direction": "usd_to_lbp" if usd_to_lbp else "lbp_to_usd",
         "start_date": start_date.isoformat(),
         "end_date": end_date.isoformat(),
-        "transaction_count": len(transactions),
+        "transaction_count": stats.count,
         "average_rate": round(avg_rate, 4),
         "min_rate": round(min_rate, 4),
         "max_rate": round(max_rate, 4),
@@ -62,11 +74,13 @@ def get_analytics():
     })
 
 @analytics_bp.route('/exchangeRateHistory', methods=['GET'])
+@response_cache.cached
 def get_exchange_rate_history():
     start_str= request.args.get('start_date')
     end_str= request.args.get('end_date')
     usd_to_lbp= request.args.get('usd_to_lbp', 'true').lower() == 'true'
     interval= request.args.get('interval', 'daily').lower()
+    ohlc= request.args.get('ohlc', 'false').lower() == 'true'#also return open/high/low/close candles per bucket
 
     if interval not in ['hourly', 'daily']:
         return jsonify({"error": "Invalid interval, use 'hourly' or 'daily'"}), 400
@@ -85,38 +99,31 @@ def get_exchange_rate_history():
     if start_date >= end_date:
         return jsonify({"error": "start_date must be before end_date"}), 400
     
-    transactions = Transaction.query.filter(
-        Transaction.added_date.between(start_date, end_date),
-        Transaction.usd_to_lbp == usd_to_lbp
-    ).order_by(Transaction.added_date).all()
-
-    if not transactions:
+    #read the pre-aggregated buckets instead of the raw transactions (the first bucket starts at the beginning of its hour/day)
+    rollups = RateRollup.query.filter(
+        RateRollup.usd_to_lbp == usd_to_lbp,
+        RateRollup.granularity == interval,
+        RateRollup.bucket_start.between(get_bucket(start_date, interval), end_date)
+    ).order_by(RateRollup.bucket_start).all()
+
+    if not rollups:
         return jsonify({"message": "No transactions found for the given range", "data": []}), 200
-    
-    def get_bucket(transac_dt, interval):
-        #the below basically rounds down every transac to the start of its bucket (hour/day)
-        if interval =='hourly':
-            return transac_dt.replace(minute=0, second=0, microsecond=0)
-        else:
-            return transac_dt.replace(hour=0, minute=0, second=0, microsecond=0)
-        
-    #the keys are bucket timestamps, teh values are lists of rates of that date bucket. put each transac in its correct bucket (date/time chunk)
-    buckets={}
-    for txn in transactions:
-        bucket_key=get_bucket(txn.added_date, interval)
-        if bucket_key not in buckets:
-            buckets[bucket_key]=[]
-        buckets[bucket_key].append(txn.lbp_amount/txn.usd_amount)
-
-    #computing teh avg rate per bucket
+
     hist=[]
-    for bucket_time, rates in sorted(buckets.items()):
-        avg_rate=sum(rates)/len(rates)
-        hist.append({
-            "timestamp": bucket_time.isoformat(),
-            "average_rate": round(avg_rate, 4),
-            "transaction_count": len(rates)
-        })
+    for rollup in rollups:
+        point = {
+            "timestamp": rollup.bucket_start.isoformat(),
+            "average_rate": round(rollup.rate_sum / rollup.transaction_count, 4),
+            "transaction_count": rollup.transaction_count
+        }
+        if ohlc:
+            point.update({
+                "open": round(rollup.open_rate, 4),
+                "high": round(rollup.high_rate, 4),
+                "low": round(rollup.low_rate, 4),
+                "close": round(rollup.close_rate, 4)
+            })
+        hist.append(point)
 
     return jsonify({
         "direction": "usd_to_lbp" if usd_to_lbp else "lbp_to_usd",
@@ -131,36 +138,70 @@ def get_data_quality():
     #import here to avoid circular imports
     #for example here, analytics_route.py imports from model/user.py, and
     # if model/user.py (or something it imports) in turn imports from analytics_route.py,
-    from model.user import User
-    import jwt
-    from service.auth_service import extract_auth_token, decode_token
-    from flask import abort
+    from service.auth_service import require_admin
 
     #require being an admin for this endpoint
-    token = extract_auth_token(request)
-    if not token:
-        abort(401)
-    try:
-        user_id = decode_token(token)
-    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-        abort(401)
-    user = User.query.get(user_id)
-    if not user or user.role != 'ADMIN':
-        abort(403)
-
-    #get all transactions grouped by source
-    internal_count = Transaction.query.filter_by(source='internal').count()
-    external_count = Transaction.query.filter_by(source='external').count()
-    outlier_count = Transaction.query.filter_by(is_outlier=True).count()
-    total_count = Transaction.query.count()
-
-    #get recent outliers for review
-    outliers = Transaction.query.filter_by(is_outlier=True).order_by(Transaction.added_date.desc()).all()
+    require_admin()
 
-    return jsonify({
-        "total_transactions": total_count,
-        "internal_transactions": internal_count,
-        "external_transactions": external_count,
+    try:
+        days = int(request.args.get('days', 30))#how many days of outlier trend to return
+    except ValueError:
+        return jsonify({"error": "days must be an integer"}), 400
+    if days <= 0 or days > 365:
+        return jsonify({"error": "days must be between 1 and 365"}), 400
+
+    #all the counts in one pass: transactions grouped by (source, is_outlier)
+    counts = db.session.query(
+        Transaction.source,
+        Transaction.is_outlier,
+        func.count(Transaction.id)
+    ).group_by(Transaction.source, Transaction.is_outlier).all()
+    source_counts = {}
+    outlier_count = 0
+    for source, is_outlier, count in counts:
+        source_counts[source] = source_counts.get(source, 0) + count
+        if is_outlier:
+            outlier_count += count
+
+    #recent outliers for review, one page at a time (newest first), see paginate for limit/cursor
+    outliers, next_cursor = paginate(Transaction.query.filter_by(is_outlier=True), Transaction.added_date, Transaction.id)
+
+    return paginated_response({
+        "total_transactions": sum(source_counts.values()),
+        "internal_transactions": source_counts.get('internal', 0),
+        "external_transactions": source_counts.get('external', 0),
         "outlier_count": outlier_count,
-        "outliers": transactions_schema.dump(outliers)
-    })
+        "outliers": transactions_schema.dump(outliers),
+        "next_cursor": next_cursor,
+        "outlier_trend": _outlier_trend(days)
+    }, next_cursor)
+
+def _outlier_trend(days):
+    #per day: outliers (from the is_outlier/added_date index) out of all transactions (from the daily rollups)
+    start_date = get_bucket(datetime.datetime.now(), 'daily') - datetime.timedelta(days=days - 1)
+    day = func.date(Transaction.added_date)
+    outliers = dict(
+        (str(d), count) for d, count in db.session.query(day, func.count(Transaction.id)).filter(
+            Transaction.is_outlier == True,
+            Transaction.added_date >= start_date
+        ).group_by(day).all()
+    )
+    totals = {}
+    for bucket_start, count in db.session.query(RateRollup.bucket_start, RateRollup.transaction_count).filter(
+        RateRollup.granularity == 'daily',
+        RateRollup.bucket_start >= start_date
+    ).all():
+        key = bucket_start.date().isoformat()
+        totals[key] = totals.get(key, 0) + count  #both directions
+
+    trend = []
+    for i in range(days):
+        key = (start_date + datetime.timedelta(days=i)).date().isoformat()
+        total, outlier = totals.get(key, 0), outliers.get(key, 0)
+        trend.append({
+            "date": key,
+            "transactions": total,
+            "outliers": outlier,
+            "outlier_rate": round(outlier / total, 4) if total else None
+        })
+    return trend
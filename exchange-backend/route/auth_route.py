@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify, abort
-from extensions import db, bcrypt, limiter
+from extensions import db, limiter
 from model.user import User, user_schema
-from service.auth_service import create_token
+from service.auth_service import create_token, get_current_user
+from service.password_service import hash_password, check_password, needs_rehash
 from service.audit_service import log_event
 
 # a blueprint is something that holds a bunch of routes, here it is called auth
@@ -38,7 +39,7 @@ def authenticate():
     user = User.query.filter_by(user_name=user_name).first()
     if not user:
         abort(403)
-    if not bcrypt.check_password_hash(user.hashed_password, password):
+    if not check_password(user.hashed_password, password):
         log_event('LOGIN_FAILED', f"Failed login attempt for: {user_name}")
         abort(403)
     
@@ -47,6 +48,20 @@ def authenticate():
         log_event('LOGIN_BLOCKED', f"Blocked login attempt for {user.status} account: {user_name}", user_id=user.id)
         return jsonify({"error": f"Account is {user.status}"}), 403
 
-    token=create_token(user.id)
+    #the password is correct, so if BCRYPT_LOG_ROUNDS changed since it was hashed we upgrade the hash now
+    if needs_rehash(user.hashed_password):
+        user.hashed_password = hash_password(password)
+        db.session.commit()
+
+    token=create_token(user.id, user.role, user.status)
     log_event('LOGIN_SUCCESSFUL', f"User logged in: {user_name}", user_id=user.id)
     return jsonify({"token": token})
+
+#profile of the logged in user (one lookup by primary key), the frontend uses it after login to know the role
+@auth_bp.route('/me', methods=['GET'])
+def get_me():
+    user_id = get_current_user()
+    user = User.query.get(user_id)
+    if not user:
+        abort(401)
+    return jsonify(user_schema.dump(user))
@@ -1,184 +1,378 @@
-from flask import Blueprint, request, jsonify, abort, make_response
-import jwt
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 import json
+import gzip
+import io
+from sqlalchemy import insert, update, func
 import datetime
 from extensions import db
-from model.user import User, users_schema
-from model.transaction import Transaction, transactions_schema
-from model.offer import Offer, offers_schema
-from model.alert import Alert, alerts_schema
+from model.user import User, user_schema
+from model.transaction import Transaction, transaction_schema
+from model.offer import Offer, offer_schema
+from model.alert import Alert, alert_schema
 from model.preference import Preference, preference_schema
-from model.watchlist import WatchlistItem, watchlist_items_schema
-from model.notification import Notification, notifications_schema
-from model.backup_record import BackupRecord, backup_record_schema, backup_records_schema
-from service.auth_service import extract_auth_token, decode_token
+from model.watchlist import WatchlistItem, watchlist_item_schema
+from model.notification import Notification, notification_schema
+from model.backup_record import BackupRecord, backup_records_schema
+from service.auth_service import require_admin
+from service.stream_service import gzip_stream
+from service.rate_engine import rate_engine
+from service.response_cache import response_cache
+from service.rollup_service import rebuild_rollups
+from service.counter_service import rebuild_rate_counters, rebuild_user_activity
+from service.order_book import order_book
 
 backup_bp = Blueprint('backup', __name__)
 
-def require_admin():
-    token = extract_auth_token(request)
-    if not token:
-        abort(401)
-    try:
-        user_id = decode_token(token)
-    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-        abort(401)
-    user = User.query.get(user_id)
-    if not user or user.role != 'ADMIN':
-        abort(403)
-    return user_id
+#tables in the order they are written to the backup (and restored), with the schema used to dump each row
+BACKUP_TABLES = [
+    ("users", User, user_schema),
+    ("transactions", Transaction, transaction_schema),
+    ("offers", Offer, offer_schema),
+    ("alerts", Alert, alert_schema),
+    ("preferences", Preference, preference_schema),
+    ("watchlist_items", WatchlistItem, watchlist_item_schema),
+    ("notifications", Notification, notification_schema)
+]
+backup_batch_size = 1000#rows fetched from the db and sent to the client at a time
+
+def _finish_record(record_id, status, counts):
+    record = BackupRecord.query.get(record_id)
+    record.status = status
+    record.record_counts = json.dumps(counts)
+    db.session.commit()
+
+#timestamp columns that tell us a row was created/changed after the previous backup, on top of the id high-water mark.
+#updated_at is set on every write of the row (offer cancelled, alert fired, notification read, user suspended...), the
+#other columns still catch rows written before updated_at existed (it is NULL there)
+INCREMENTAL_COLUMNS = {
+    "users": ["updated_at"],
+    "transactions": ["added_date"],
+    "offers": ["creation_date", "accepted_at", "updated_at"],
+    "alerts": ["creation_date", "updated_at"],
+    "preferences": ["updated_at"],
+    "watchlist_items": ["created_at"],
+    "notifications": ["created_at", "updated_at"]
+}
+
+def _line(entry):
+    return json.dumps(entry, default=str) + "\n"
+
+def _incremental_filter(name, model, marks):
+    #rows with an id above the last backup's max id, or with a timestamp after the last backup started
+    since = datetime.datetime.fromisoformat(marks["timestamp"])
+    conditions = [model.id > marks["max_ids"].get(name, 0)]
+    conditions += [getattr(model, column) > since for column in INCREMENTAL_COLUMNS[name]]
+    return db.or_(*conditions)
 
 #trigger a manual backup (as an admin)
+#the backup is streamed as NDJSON (one json object per line), table by table: a header line, one "row" line per record,
+#a "table_end" line with the count of each table, and a footer with all the counts
+#with ?mode=incremental only the rows created/changed since the last successful backup are exported
 @backup_bp.route('/admin/backup', methods=['POST'])
 def create_backup():
     admin_id = require_admin()
+    compress = request.args.get('compress', '').lower() == 'gzip'
+    mode = request.args.get('mode', 'full').lower()
+    if mode not in ['full', 'incremental']:
+        return jsonify({"error": "mode must be 'full' or 'incremental'"}), 400
 
-    try:
-        # collect all data
-        users = User.query.all()
-        transactions = Transaction.query.all()
-        offers = Offer.query.all()
-        alerts = Alert.query.all()
-        preferences = Preference.query.all()
-        watchlist_items = WatchlistItem.query.all()
-        notifications = Notification.query.all()
-
-        backup_data = {
-            "backup_timestamp": datetime.datetime.now().isoformat(),
-            "users": users_schema.dump(users),
-            "transactions": transactions_schema.dump(transactions),
-            "offers": offers_schema.dump(offers),
-            "alerts": alerts_schema.dump(alerts),
-            "preferences": [preference_schema.dump(p) for p in preferences],
-            "watchlist_items": watchlist_items_schema.dump(watchlist_items),
-            "notifications": notifications_schema.dump(notifications)
-        }
-
-        #record the counts for status tracking
-        counts = {
-            "users": len(users),
-            "transactions": len(transactions),
-            "offers": len(offers),
-            "alerts": len(alerts),
-            "preferences": len(preferences),
-            "watchlist_items": len(watchlist_items),
-            "notifications": len(notifications)
-        }
-
-        #save backup record to db
-        record = BackupRecord(
-            triggered_by=admin_id,
-            status='success',
-            record_counts=json.dumps(counts)
-        )
-        db.session.add(record)
-        db.session.commit()
+    base = None
+    base_id = None
+    if mode == 'incremental':
+        base = BackupRecord.query.filter(
+            BackupRecord.status == 'success',
+            BackupRecord.high_water_marks != None
+        ).order_by(BackupRecord.id.desc()).first()
+        if not base:
+            return jsonify({"error": "No successful backup to continue from, run a full backup first"}), 400
+        base_id = base.id
+        base_marks = json.loads(base.high_water_marks)
 
-        #return as downloadable json file
-        response = make_response(json.dumps(backup_data, indent=2, default=str))
-        response.headers['Content-Type'] = 'application/json'
-        response.headers['Content-Disposition'] = f'attachment; filename=backup_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
-        return response
+    #the high-water marks of this backup are taken before reading anything, so the next incremental one starts from here
+    marks = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "max_ids": {name: db.session.query(func.max(model.id)).scalar() or 0 for name, model, schema in BACKUP_TABLES}
+    }
+    record = BackupRecord(
+        triggered_by=admin_id,
+        status='running',
+        record_counts=json.dumps({}),
+        backup_type=mode,
+        base_backup_id=base_id,
+        high_water_marks=json.dumps(marks)
+    )
+    db.session.add(record)
+    db.session.commit()
+    record_id = record.id
 
-    except Exception as e:
-        #record failed backup attempt
-        record = BackupRecord(
-            triggered_by=admin_id,
-            status='failed',
-            record_counts=json.dumps({})
-        )
-        db.session.add(record)
+    def generate():
+        counts = {}
+        try:
+            yield _line({
+                "type": "header",
+                "format": "ndjson",
+                "backup_id": record_id,
+                "backup_type": mode,
+                "base_backup_id": base_id,
+                "backup_timestamp": marks["timestamp"]
+            })
+            for name, model, schema in BACKUP_TABLES:
+                query = model.query
+                if base_id:
+                    query = query.filter(_incremental_filter(name, model, base_marks))
+                count = 0
+                batch = []
+                for obj in query.order_by(model.id).yield_per(backup_batch_size):
+                    batch.append(_line({"type": "row", "table": name, "data": schema.dump(obj)}))
+                    count += 1
+                    if len(batch) >= backup_batch_size:
+                        yield "".join(batch)
+                        batch = []
+                batch.append(_line({"type": "table_end", "table": name, "count": count}))
+                yield "".join(batch)
+                counts[name] = count
+            yield _line({"type": "footer", "record_counts": counts})
+        except Exception as e:
+            #the response already started so we cant send a 500 anymore, we end the stream with an error line instead
+            db.session.rollback()
+            _finish_record(record_id, 'failed', counts)
+            yield _line({"type": "error", "error": f"Backup failed: {str(e)}"})
+            return
+        except GeneratorExit:
+            #the client went away before the end of the stream
+            db.session.rollback()
+            _finish_record(record_id, 'failed', counts)
+            raise
+
+        #mark the backup record as successful once the whole stream went through
+        _finish_record(record_id, 'success', counts)
+
+    filename = f'backup_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.ndjson'
+    if compress:
+        response = Response(stream_with_context(gzip_stream(generate())), mimetype='application/gzip')
+        filename += '.gz'
+    else:
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+def _date(value):
+    return datetime.datetime.fromisoformat(value) if value else None
+
+#turn a dumped row back into the column values of its table
+def _user_row(u):
+    return {
+        "id": u['id'],
+        "user_name": u['user_name'],
+        "hashed_password": '',
+        "role": u.get('role', 'USER'),
+        "status": u.get('status', 'active'),
+        "updated_at": _date(u.get('updated_at'))
+    }
+
+def _transaction_row(t):
+    return {
+        "id": t['id'],
+        "usd_amount": t['usd_amount'],
+        "lbp_amount": t['lbp_amount'],
+        "usd_to_lbp": t['usd_to_lbp'],
+        "user_id": t.get('user_id'),
+        "added_date": _date(t.get('added_date')) or datetime.datetime.now(),
+        "source": t.get('source', 'internal'),
+        "is_outlier": t.get('is_outlier', False)
+    }
+
+def _offer_row(o):
+    return {
+        "id": o['id'],
+        "user_id": o['user_id'],
+        "usd_amount": o['usd_amount'],
+        "lbp_amount": o['lbp_amount'],
+        "usd_to_lbp": o['usd_to_lbp'],
+        "status": o.get('status', 'available'),
+        "creation_date": _date(o.get('creation_date') or o.get('created_at')) or datetime.datetime.now(),
+        "accepted_by": o.get('accepted_by'),
+        "accepted_at": _date(o.get('accepted_at')),
+        "updated_at": _date(o.get('updated_at'))
+    }
+
+def _alert_row(a):
+    return {
+        "id": a['id'],
+        "user_id": a['user_id'],
+        "usd_to_lbp": a['usd_to_lbp'],
+        "threshold": a['threshold'],
+        "direction": a['direction'],
+        "creation_date": _date(a.get('creation_date')) or datetime.datetime.now(),
+        "state": a.get('state', 'armed'),
+        "last_rate": a.get('last_rate'),
+        "rearm_margin": a.get('rearm_margin', 0),
+        "updated_at": _date(a.get('updated_at'))
+    }
+
+def _preference_row(p):
+    return {
+        "id": p['id'],
+        "user_id": p['user_id'],
+        "default_interval": p.get('default_interval', 'daily'),
+        "default_time_range": p.get('default_time_range', 72),
+        "default_usd_to_lbp": p.get('default_usd_to_lbp', True),
+        "updated_at": _date(p.get('updated_at')) or datetime.datetime.now()
+    }
+
+def _watchlist_item_row(w):
+    return {
+        "id": w['id'],
+        "user_id": w['user_id'],
+        "label": w['label'],
+        "usd_to_lbp": w['usd_to_lbp'],
+        "target_rate": w.get('target_rate'),
+        "created_at": _date(w.get('created_at')) or datetime.datetime.now()
+    }
+
+def _notification_row(n):
+    return {
+        "id": n['id'],
+        "user_id": n['user_id'],
+        "title": n['title'],
+        "message": n['message'],
+        "is_read": n.get('is_read', False),
+        "created_at": _date(n.get('created_at')) or datetime.datetime.now(),
+        "updated_at": _date(n.get('updated_at'))
+    }
+
+RESTORE_TABLES = {
+    "users": (User, _user_row),
+    "transactions": (Transaction, _transaction_row),
+    "offers": (Offer, _offer_row),
+    "alerts": (Alert, _alert_row),
+    "preferences": (Preference, _preference_row),
+    "watchlist_items": (WatchlistItem, _watchlist_item_row),
+    "notifications": (Notification, _notification_row)
+}
+restore_batch_size = 1000#rows checked and inserted per query/commit
+
+def _ndjson_entries(stream):
+    #read the backup line by line straight from the request body, so the whole file is never in memory
+    for line in stream:
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        if entry.get("type") == "header":
+            yield "header", entry
+        elif entry.get("type") == "row":
+            yield entry["table"], entry["data"]
+        elif entry.get("type") == "error":
+            raise ValueError("this backup did not complete: " + entry.get("error", ""))
+
+def _json_entries(backup_data):
+    #old single-json backups, same table order as the streamed ones
+    for name, model, schema in BACKUP_TABLES:
+        for row in backup_data.get(name, []):
+            yield name, row
+
+#columns an incremental restore never overwrites on a row that already exists (backups dont carry the password hashes)
+KEEP_ON_UPDATE = {"users": ["hashed_password"]}
+
+def _restore_chunk(table, rows, summary, upsert):
+    #one query to find which ids already exist, one bulk insert for the missing rows, one commit per chunk
+    #(incremental backups also carry rows that changed, those are bulk updated by id instead of skipped)
+    model = RESTORE_TABLES[table][0]
+    ids = [row["id"] for row in rows]
+    existing = {row_id for (row_id,) in db.session.query(model.id).filter(model.id.in_(ids))}
+    missing = [row for row in rows if row["id"] not in existing]
+    if missing:
+        db.session.execute(insert(model), missing)
+    if upsert and existing:
+        changed = [{k: v for k, v in row.items() if k not in KEEP_ON_UPDATE.get(table, [])} for row in rows if row["id"] in existing]
+        db.session.execute(update(model), changed)
+        summary[table]["updated"] += len(changed)
+    else:
+        summary[table]["skipped"] += len(rows) - len(missing)
+    db.session.commit()
+    summary[table]["restored"] += len(missing)
+    current_app.logger.info(f"restore: {table} {summary[table]['restored']} restored, {summary[table]['updated']} updated, {summary[table]['skipped']} already there")
+
+def restore_entries(entries, summary):
+    #a full backup only adds the missing rows, an incremental one (told by its header) also updates the existing ones,
+    #so a full backup followed by its chain of incrementals can be replayed in order. the counts go into summary as
+    #the chunks are committed, so the caller still has them if a later chunk fails
+    upsert = False
+    table, chunk = None, []
+    for name, data in entries:
+        if name == "header":
+            upsert = data.get("backup_type") == "incremental"
+            continue
+        if name not in RESTORE_TABLES:
+            continue
+        if chunk and (name != table or len(chunk) >= restore_batch_size):
+            _restore_chunk(table, chunk, summary, upsert)
+            chunk = []
+        table = name
+        summary.setdefault(name, {"restored": 0, "updated": 0, "skipped": 0})
+        chunk.append(RESTORE_TABLES[name][1](data))
+    if chunk:
+        _restore_chunk(table, chunk, summary, upsert)
+    return summary
+
+def _changed(summary, table):
+    return summary.get(table, {}).get("restored") or summary.get(table, {}).get("updated")
+
+def _rebuild_after_restore(summary):
+    #recompute what is derived from the restored rows
+    if _changed(summary, "transactions"):
+        #the restored transactions can be older than what the rate engine and rollups already saw
+        rebuild_rollups(db.session)
+        rebuild_rate_counters(db.session)
         db.session.commit()
-        return jsonify({"error": f"Backup failed: {str(e)}"}), 500
-    
-#restore data from  json backup
+        rate_engine.reset()
+        response_cache.bump()
+
+    if _changed(summary, "transactions") or _changed(summary, "offers"):
+        rebuild_user_activity(db.session)
+        db.session.commit()
+
+    if _changed(summary, "offers"):
+        order_book.reset()
+
+#restore data from a backup (streamed NDJSON, or the old single json format)
 @backup_bp.route('/admin/restore', methods=['POST'])
 def restore_backup():
     require_admin()
 
-    backup_data = request.json
-    if not backup_data:
-        return jsonify({"error": "No backup data provided"}), 400
+    if request.mimetype == 'application/x-ndjson':
+        stream = request.stream
+        if request.headers.get('Content-Encoding') == 'gzip':
+            stream = gzip.GzipFile(fileobj=stream)
+        entries = _ndjson_entries(io.TextIOWrapper(stream, encoding='utf-8'))
+    else:
+        backup_data = request.get_json(silent=True)
+        if not backup_data:
+            return jsonify({"error": "No backup data provided"}), 400
+        entries = _json_entries(backup_data)
 
+    summary = {}
     try:
-        #restore users
-        for u in backup_data.get('users', []):
-            existing = User.query.get(u['id'])
-            if not existing:
-                user = User.__new__(User)
-                user.id = u['id']
-                user.user_name = u['user_name']
-                user.hashed_password = ''
-                user.role = u.get('role', 'USER')
-                user.status = u.get('status', 'active')
-                db.session.add(user)
-
-        #restore transactions
-        for t in backup_data.get('transactions', []):
-            existing = Transaction.query.get(t['id'])
-            if not existing:
-                txn = Transaction.__new__(Transaction)
-                txn.id = t['id']
-                txn.usd_amount = t['usd_amount']
-                txn.lbp_amount = t['lbp_amount']
-                txn.usd_to_lbp = t['usd_to_lbp']
-                txn.user_id = t.get('user_id')
-                txn.added_date = datetime.datetime.fromisoformat(t['added_date']) if t.get('added_date') else datetime.datetime.now()
-                txn.source = t.get('source', 'internal')
-                txn.is_outlier = t.get('is_outlier', False)
-                db.session.add(txn)
-
-        #restore offers
-        for o in backup_data.get('offers', []):
-            existing = Offer.query.get(o['id'])
-            if not existing:
-                offer = Offer.__new__(Offer)
-                offer.id = o['id']
-                offer.user_id = o['user_id']
-                offer.usd_amount = o['usd_amount']
-                offer.lbp_amount = o['lbp_amount']
-                offer.usd_to_lbp = o['usd_to_lbp']
-                offer.status = o.get('status', 'open')
-                offer.created_at = datetime.datetime.fromisoformat(o['created_at']) if o.get('created_at') else datetime.datetime.now()
-                offer.accepted_by = o.get('accepted_by')
-                offer.accepted_at = datetime.datetime.fromisoformat(o['accepted_at']) if o.get('accepted_at') else None
-                db.session.add(offer)
-
-        #restore alerts
-        for a in backup_data.get('alerts', []):
-            existing = Alert.query.get(a['id'])
-            if not existing:
-                alert = Alert.__new__(Alert)
-                alert.id = a['id']
-                alert.user_id = a['user_id']
-                alert.usd_to_lbp = a['usd_to_lbp']
-                alert.threshold = a['threshold']
-                alert.direction = a['direction']
-                alert.creation_date = datetime.datetime.fromisoformat(a['creation_date']) if a.get('creation_date') else datetime.datetime.now()
-                db.session.add(alert)
-
-        #restore preferences
-        for p in backup_data.get('preferences', []):
-            existing = Preference.query.get(p['id'])
-            if not existing:
-                pref = Preference.__new__(Preference)
-                pref.id = p['id']
-                pref.user_id = p['user_id']
-                pref.default_interval = p.get('default_interval', 'daily')
-                pref.default_time_range = p.get('default_time_range', 72)
-                pref.default_usd_to_lbp = p.get('default_usd_to_lbp', True)
-                pref.updated_at = datetime.datetime.fromisoformat(p['updated_at']) if p.get('updated_at') else datetime.datetime.now()
-                db.session.add(pref)
-
-        db.session.commit()
-        return jsonify({
-            "message": "Backup restored successfully",
-            "restored_at": datetime.datetime.now().isoformat()
-        })
-
+        restore_entries(entries, summary)
+    except (ValueError, KeyError) as e:
+        db.session.rollback()
+        return jsonify({"error": f"Invalid backup file: {str(e)}", "tables": summary}), 400
     except Exception as e:
         db.session.rollback()
-        return jsonify({"error": f"Restore failed: {str(e)}"}), 500
+        return jsonify({"error": f"Restore failed: {str(e)}", "tables": summary}), 500
+    finally:
+        #every chunk is committed on its own, so the ones before a failing chunk are already in the db and their
+        #rollups/counters/caches have to be rebuilt too
+        _rebuild_after_restore(summary)
+
+    if not summary:
+        return jsonify({"error": "No backup data provided"}), 400
+
+    return jsonify({
+        "message": "Backup restored successfully",
+        "restored_at": datetime.datetime.now().isoformat(),
+        "tables": summary
+    })
     
 #check backup history and status
 @backup_bp.route('/admin/backup/status', methods=['GET'])
@@ -197,6 +391,8 @@ def get_backup_status():
             "timestamp": last_backup.timestamp.isoformat(),
             "status": last_backup.status,
             "triggered_by": last_backup.triggered_by,
+            "backup_type": last_backup.backup_type,
+            "base_backup_id": last_backup.base_backup_id,
             "record_counts": json.loads(last_backup.record_counts)
         },
         "total_backups": len(records),
@@ -1,22 +1,27 @@
-from flask import Blueprint, request, jsonify, abort
-import jwt
+from flask import Blueprint, request, jsonify, current_app
 import datetime
 from extensions import db, limiter
 from model.offer import Offer, offer_schema, offers_schema
-from service.auth_service import extract_auth_token, decode_token
+from service.auth_service import get_current_user
 from service.audit_service import log_event
-from service.notification_service import check_and_notify, send_notification
+from service.notification_service import send_notification
+from service.alert_worker import alert_worker
+from service.pagination import paginate, paginated_response
+from service.order_book import order_book
+from service.counter_service import record_user_activity
 
 marketplace_bp=Blueprint('marketplace', __name__)
 
-def get_current_user():
-    token=extract_auth_token(request)
-    if not token:
-        abort(401)
-    try:
-        return decode_token(token)
-    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-        abort (401)
+def claim_offer(offer_id, values, *conditions):
+    #moves an available offer to a new status with a single conditional UPDATE ... WHERE id=? AND status='available'.
+    #the db checks and writes in one statement, so of two concurrent requests only one can change the row (the other
+    #gets rowcount 0) without taking a row lock first. returns True if this request won
+    claimed = Offer.query.filter(
+        Offer.id == offer_id,
+        Offer.status == 'available',
+        *conditions
+    ).update(values, synchronize_session=False)
+    return claimed == 1
 
 #create a new offer
 @marketplace_bp.route('/market/offers', methods=['POST'])
@@ -25,6 +30,7 @@ def create_offer():
     usd_amount = request.json.get('usd_amount')
     lbp_amount = request.json.get('lbp_amount')
     usd_to_lbp = request.json.get('usd_to_lbp')
+    auto_match = request.json.get('auto_match', False)#if true, the offer is matched right away with the best compatible offer of the book
 
     if usd_amount is None or lbp_amount is None or usd_to_lbp is None:
         return jsonify({"error": "usd_amount, lbp_amount, and usd_to_lbp are required"}), 400
@@ -40,9 +46,38 @@ def create_offer():
         usd_to_lbp=bool(usd_to_lbp)
     )
     db.session.add(offer)
+
+    match = None
+    if auto_match is True:
+        #no autoflush: if the book is stale it reloads the available offers, and it must not load our own pending offer
+        with db.session.no_autoflush:
+            match_id = order_book.find_match(offer.usd_to_lbp, offer.usd_amount, offer.lbp_amount, user_id)
+        #the book can be a little behind, so the candidate is claimed in the db, if someone else took it first we just post the offer
+        if match_id and claim_offer(match_id, {"status": 'accepted', "accepted_by": user_id, "accepted_at": offer.creation_date}):
+            match = Offer.query.get(match_id)
+    if match:
+        #both offers are filled by each other in the same commit
+        offer.status, offer.accepted_by, offer.accepted_at = 'accepted', match.user_id, offer.creation_date
+        db.session.flush()
+        send_notification(db.session, match.user_id, "Offer Accepted", f"Your offer #{match.id} was matched with offer #{offer.id}")
+        send_notification(db.session, user_id, "Trade Completed", f"Your offer #{offer.id} was matched with offer #{match.id}")
+        #each side accepted the other's offer
+        record_user_activity(db.session, match.user_id, offers_accepted=1)
+    record_user_activity(db.session, user_id, offers_posted=1, offers_accepted=1 if match else 0)
     db.session.commit()
     log_event('OFFER_CREATED', f"Offer created: {usd_amount} USD / {lbp_amount} LBP", user_id=user_id)
-    return jsonify(offer_schema.dump(offer))
+
+    if not match:
+        order_book.add(offer)
+        if auto_match is True:
+            return jsonify({**offer_schema.dump(offer), "matched_offer": None})
+        return jsonify(offer_schema.dump(offer))
+
+    order_book.remove(match.id)
+    order_book.remove(offer.id)#in case a rebuild picked it up after the commit
+    log_event('OFFER_MATCHED', f"Offer {offer.id} matched with offer {match.id}", user_id=user_id)
+    alert_worker.submit()
+    return jsonify({**offer_schema.dump(offer), "matched_offer": offer_schema.dump(match)})
 
 #view/browse available offers 
 @marketplace_bp.route('/market/offers', methods=['GET'])
@@ -55,55 +90,81 @@ def get_available_offers():
     #     usd_to_lbp = usd_to_lbp_str.lower() == 'true'
     #     query = query.filter_by(usd_to_lbp=usd_to_lbp)
 
-    available_offers=Offer.query.filter_by(status='available').order_by(Offer.creation_date.desc()).all()
-    return jsonify(offers_schema.dump(available_offers))
+    available_offers, next_cursor = paginate(Offer.query.filter_by(status='available'), Offer.creation_date, Offer.id)
+    return paginated_response(offers_schema.dump(available_offers), next_cursor)
+
+#order book: best bid/ask and the first price levels of each side, served from memory
+@marketplace_bp.route('/market/book', methods=['GET'])
+def get_order_book():
+    try:
+        depth = int(request.args.get('depth', 10))
+    except ValueError:
+        return jsonify({"error": "depth must be an integer"}), 400
+    if depth <= 0 or depth > 100:
+        return jsonify({"error": "depth must be between 1 and 100"}), 400
+    return jsonify(order_book.snapshot(depth))
 
 #accept offer      
 @marketplace_bp.route('/market/offers/<int:offer_id>/accept', methods=['POST'])
 @limiter.limit("5 per minute")#note: this automatically returns the 429 error too many requests
 def accept_offer(offer_id):
     user_id = get_current_user()
-    offer = Offer.query.get(offer_id)
-
-    if not offer:
-        return jsonify({"error": "Offer not found"}), 404
-    if offer.status != 'available':
-        return jsonify({"error": "Offer is no longer available"}), 400
-    if offer.user_id == user_id:
-        return jsonify({"error": "You can't accept your own offer"}), 400
 
     try:
-        offer.status = 'accepted'
-        offer.accepted_by = user_id
-        offer.accepted_at = datetime.datetime.now()
-        db.session.commit()
+        if not claim_offer(offer_id, {
+            "status": 'accepted',
+            "accepted_by": user_id,
+            "accepted_at": datetime.datetime.now()
+        }, Offer.user_id != user_id):
+            #lost (or never could win): only now we read the offer to tell the caller why
+            db.session.rollback()
+            offer = Offer.query.get(offer_id)
+            if not offer:
+                return jsonify({"error": "Offer not found"}), 404
+            if offer.user_id == user_id:
+                return jsonify({"error": "You can't accept your own offer"}), 400
+            return jsonify({"error": "Offer is no longer available"}), 409
+
+        offer = Offer.query.get(offer_id)
         send_notification(db.session, offer.user_id, "Offer Accepted", f"Your offer #{offer.id} has been accepted")
         send_notification(db.session, user_id, "Trade Completed", f"You successfully accepted offer #{offer.id}")
-        check_and_notify(db.session)
-        log_event('OFFER_ACCEPTED', f"Offer {offer_id} accepted", user_id=user_id)
+        record_user_activity(db.session, user_id, offers_accepted=1)
+        db.session.commit()#one commit for the offer and both notifications
 
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": "Could not accept offer, please try again"}), 500
 
+    #the offer is accepted in the db from here on, a failure below is logged instead of answering 500
+    try:
+        order_book.remove(offer.id)
+        log_event('OFFER_ACCEPTED', f"Offer {offer_id} accepted", user_id=user_id)
+    except Exception:
+        current_app.logger.exception(f"Post-commit update failed for offer {offer_id}")
+
+    alert_worker.submit()
+
     return jsonify(offer_schema.dump(offer))
 
 #cancel/delete offer
 @marketplace_bp.route('/market/offers/<int:offer_id>', methods=['DELETE'])
 def cancel_offer(offer_id):
     user_id = get_current_user()
-    offer = Offer.query.get(offer_id)
 
-    if not offer:
-        return jsonify({"error": "Offer not found"}), 404
-    if offer.user_id != user_id:
-        return jsonify({"error": "You can only cancel your own offers"}), 403
-    if offer.status != 'available':
+    #same conditional update as accept, so a cancel can never overwrite an offer that was just accepted
+    if not claim_offer(offer_id, {"status": 'canceled'}, Offer.user_id == user_id):
+        db.session.rollback()
+        offer = Offer.query.get(offer_id)
+        if not offer:
+            return jsonify({"error": "Offer not found"}), 404
+        if offer.user_id != user_id:
+            return jsonify({"error": "You can only cancel your own offers"}), 403
         return jsonify({"error": "Only available offers can be canceled"}), 400
 
-    offer.status = 'canceled'
-    db.session.commit()
+    offer = Offer.query.get(offer_id)
     send_notification(db.session, user_id, "Offer Canceled", f"Your offer #{offer_id} has been canceled")
+    db.session.commit()
+    order_book.remove(offer_id)
     log_event('OFFER_CANCELED', f"Offer {offer_id} canceled", user_id=user_id)
     return jsonify({"message": "Offer canceled successfully", "offer": offer_schema.dump(offer)})
 
@@ -111,8 +172,8 @@ def cancel_offer(offer_id):
 @marketplace_bp.route('/market/trades', methods=['GET'])
 def get_my_trades():
     user_id=get_current_user()
-    trades= Offer.query.filter(
+    trades, next_cursor = paginate(Offer.query.filter(
         Offer.status=='accepted',
         db.or_(Offer.user_id == user_id, Offer.accepted_by == user_id)
-    ).order_by(Offer.accepted_at.desc()).all()
-    return jsonify(offers_schema.dump(trades))
+    ), Offer.accepted_at, Offer.id)
+    return paginated_response(offers_schema.dump(trades), next_cursor)
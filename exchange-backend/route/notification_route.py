@@ -1,29 +1,21 @@
-from flask import Blueprint, request, jsonify, abort
-import jwt
+from flask import Blueprint, jsonify
 from extensions import db
 from model.notification import Notification, notification_schema, notifications_schema
-from service.auth_service import extract_auth_token, decode_token
+from service.auth_service import get_current_user
+from service.pagination import paginate, paginated_response
 
 notifications_bp = Blueprint('notifications', __name__)
 
-def get_current_user():
-    token = extract_auth_token(request)
-    if not token:
-        abort(401)
-    try:
-        return decode_token(token)
-    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-        abort(401)
-
 @notifications_bp.route('/notifications', methods=['GET'])
 def get_notifications():
     user_id = get_current_user()
-    notifications = Notification.query.filter_by(user_id=user_id).order_by(Notification.created_at.desc()).all()
+    notifications, next_cursor = paginate(Notification.query.filter_by(user_id=user_id), Notification.created_at, Notification.id)
     unread_count = Notification.query.filter_by(user_id=user_id, is_read=False).count()
-    return jsonify({
+    return paginated_response({
         "unread_count": unread_count,
-        "notifications": notifications_schema.dump(notifications)
-    })
+        "notifications": notifications_schema.dump(notifications),
+        "next_cursor": next_cursor
+    }, next_cursor)
 
 @notifications_bp.route('/notifications/<int:notification_id>/read', methods=['PUT'])
 def mark_as_read(notification_id):
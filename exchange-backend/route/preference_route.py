@@ -1,22 +1,12 @@
-from flask import Blueprint, request, jsonify, abort
-import jwt
+from flask import Blueprint, request, jsonify
 import datetime
 from extensions import db
 from model.preference import Preference, preference_schema
-from service.auth_service import extract_auth_token, decode_token
+from service.auth_service import get_current_user
 from service.audit_service import log_event
 
 preferences_bp = Blueprint('preferences', __name__)
 
-def get_current_user():
-    token = extract_auth_token(request)
-    if not token:
-        abort(401)
-    try:
-        return decode_token(token)
-    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-        abort(401)
-
 #create preferences
 @preferences_bp.route('/preferences', methods=['POST'])
 def create_preferences():
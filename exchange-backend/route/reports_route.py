@@ -1,26 +1,15 @@
-from flask import Blueprint, request, jsonify, abort
-import jwt
+from flask import Blueprint, request, jsonify
 import datetime
 from extensions import db
-from model.transaction import Transaction, transactions_schema
+from model.transaction import Transaction
 from model.offer import Offer
-from model.user import User
-from service.auth_service import extract_auth_token, decode_token
+from model.user_activity import UserActivity
+from service.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from service.auth_service import require_admin
 from sqlalchemy import func
+from service.rollup_service import sql_bucket, SQL_INTERVALS, BUCKET_FORMAT
 reports_bp = Blueprint('reports', __name__)
 
-def require_admin():
-    token = extract_auth_token(request)
-    if not token:
-        abort(401)
-    try:
-        user_id = decode_token(token)
-    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-        abort(401)
-    user = User.query.get(user_id)
-    if not user or user.role != 'ADMIN':
-        abort(403)
-
 #get transaction volume report(as admin)
 @reports_bp.route('/admin/reports/transactions', methods=['GET'])
 def transaction_volume_report():
@@ -39,50 +28,115 @@ def transaction_volume_report():
     except ValueError:
         return jsonify({"error": "Invalid date format. Use MM/DD/YYYY"}), 400
 
-    transactions = Transaction.query.filter(
-        Transaction.added_date.between(start_date, end_date)
-    ).all()
+    by_source = request.args.get('by_source', 'false').lower() == 'true'#also split the volume by source
+    interval = request.args.get('interval')#optional: also return the volume over time, per hour/day/week
+    if interval:
+        interval = interval.lower()
+        if interval not in SQL_INTERVALS:
+            return jsonify({"error": "interval must be 'hourly', 'daily' or 'weekly'"}), 400
 
-    total_usd_volume = sum(t.usd_amount for t in transactions)
-    total_lbp_volume = sum(t.lbp_amount for t in transactions)
-    usd_to_lbp_count = sum(1 for t in transactions if t.usd_to_lbp)
-    lbp_to_usd_count = sum(1 for t in transactions if not t.usd_to_lbp)
+    in_range = Transaction.added_date.between(start_date, end_date)
 
-    return jsonify({
+    #everything is summed by the db: at most one row per (direction, source)
+    rows = db.session.query(
+        Transaction.usd_to_lbp,
+        Transaction.source,
+        func.count(Transaction.id),
+        func.sum(Transaction.usd_amount),
+        func.sum(Transaction.lbp_amount)
+    ).filter(in_range).group_by(Transaction.usd_to_lbp, Transaction.source).all()
+
+    counts = {True: 0, False: 0}
+    total_usd_volume = 0
+    total_lbp_volume = 0
+    sources = []
+    for usd_to_lbp, source, count, usd_volume, lbp_volume in rows:
+        counts[bool(usd_to_lbp)] += count
+        total_usd_volume += usd_volume or 0
+        total_lbp_volume += lbp_volume or 0
+        sources.append({
+            "usd_to_lbp": bool(usd_to_lbp),
+            "source": source,
+            "transactions": count,
+            "usd_volume": round(usd_volume or 0, 2),
+            "lbp_volume": round(lbp_volume or 0, 2)
+        })
+
+    report = {
         "start_date": start_date.isoformat(),
         "end_date": end_date.isoformat(),
-        "total_transactions": len(transactions),
-        "usd_to_lbp_transactions": usd_to_lbp_count,
-        "lbp_to_usd_transactions": lbp_to_usd_count,
+        "total_transactions": counts[True] + counts[False],
+        "usd_to_lbp_transactions": counts[True],
+        "lbp_to_usd_transactions": counts[False],
         "total_usd_volume": round(total_usd_volume, 2),
         "total_lbp_volume": round(total_lbp_volume, 2)
-    })
+    }
+    if by_source:
+        report["by_source"] = sources
+
+    if interval:
+        #volume time series, bucketed in sql so only one row per (bucket, direction) comes back
+        bucket = sql_bucket(Transaction.added_date, interval)
+        series = db.session.query(
+            bucket,
+            Transaction.usd_to_lbp,
+            func.count(Transaction.id),
+            func.sum(Transaction.usd_amount),
+            func.sum(Transaction.lbp_amount)
+        ).filter(in_range).group_by(bucket, Transaction.usd_to_lbp).order_by(bucket).all()
+        report["interval"] = interval
+        report["series"] = [{
+            "bucket_start": datetime.datetime.strptime(str(bucket_start), BUCKET_FORMAT).isoformat(),
+            "usd_to_lbp": bool(usd_to_lbp),
+            "transactions": count,
+            "usd_volume": round(usd_volume or 0, 2),
+            "lbp_volume": round(lbp_volume or 0, 2)
+        } for bucket_start, usd_to_lbp, count, usd_volume, lbp_volume in series]
+
+    return jsonify(report)
 
 #get most active users report(as admin)
 @reports_bp.route('/admin/reports/users', methods=['GET'])
 def user_activity_report():
     require_admin()
 
-    #use db aggregation to count transactions per user
-    transaction_counts = db.session.query(
-        Transaction.user_id,
-        func.count(Transaction.id).label('transaction_count')
-    ).filter(
-        Transaction.user_id != None
-    ).group_by(Transaction.user_id).order_by(
-        func.count(Transaction.id).desc()
-    ).all()
-
-    #count offers per user
-    offer_counts = db.session.query(
-        Offer.user_id,
-        func.count(Offer.id).label('offer_count')
-    ).group_by(Offer.user_id).order_by(
-        func.count(Offer.id).desc()
-    ).all()
-
-    transaction_data = [{"user_id": r.user_id, "transaction_count": r.transaction_count} for r in transaction_counts]
-    offer_data = [{"user_id": r.user_id, "offer_count": r.offer_count} for r in offer_counts]
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))#top-K users of each ranking
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit <= 0:
+        return jsonify({"error": "limit must be positive"}), 400
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    query = UserActivity.query
+    since_str = request.args.get('since')#only users active on or after this date
+    if since_str:
+        try:
+            since = datetime.datetime.strptime(since_str, "%m/%d/%Y")
+        except ValueError:
+            return jsonify({"error": "Invalid date format. Use MM/DD/YYYY"}), 400
+        query = query.filter(UserActivity.last_active_at >= since)
+
+    #read from the per user counters, each ranking walks its own index and stops after `limit` rows
+    by_transactions = query.filter(UserActivity.transaction_count > 0).order_by(
+        UserActivity.transaction_count.desc(), UserActivity.user_id.desc()
+    ).limit(limit).all()
+    by_offers = query.filter(UserActivity.offers_posted > 0).order_by(
+        UserActivity.offers_posted.desc(), UserActivity.user_id.desc()
+    ).limit(limit).all()
+
+    transaction_data = [{
+        "user_id": a.user_id,
+        "transaction_count": a.transaction_count,
+        "usd_volume": round(a.usd_volume, 2),
+        "last_active_at": a.last_active_at.isoformat() if a.last_active_at else None
+    } for a in by_transactions]
+    offer_data = [{
+        "user_id": a.user_id,
+        "offer_count": a.offers_posted,
+        "offers_accepted": a.offers_accepted,
+        "last_active_at": a.last_active_at.isoformat() if a.last_active_at else None
+    } for a in by_offers]
 
     return jsonify({
         "most_active_by_transactions": transaction_data,
@@ -1,41 +1,31 @@
-from flask import Blueprint, request, jsonify, abort, make_response
+from flask import Blueprint, request, jsonify, abort, g, Response, stream_with_context, current_app
 import datetime
-import jwt
 from extensions import db, limiter
 from model.transaction import Transaction, transaction_schema, transactions_schema
-from service.auth_service import extract_auth_token, decode_token
+from service.auth_service import get_current_user
 import csv
 import io
 from service.audit_service import log_event
-from service.notification_service import check_and_notify
+from service.alert_worker import alert_worker
+from service.rate_engine import rate_engine
+from service.response_cache import response_cache
+from service.rollup_service import apply_transaction
+from service.counter_service import increment_rate_counter, record_user_activity
+from service.stream_service import gzip_stream
+from service.pagination import paginate, paginated_response
 
 outlier_threshold = 0.5
+export_batch_size = 1000#rows fetched from the db and sent to the client at a time by /export
 
 transactions_bp= Blueprint('transactions', __name__)
 
-def get_current_user():
-    token = extract_auth_token(request)
-    if not token:
-        abort(401)
-    try:
-        return decode_token(token)
-    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-        abort(401)
-
 def is_outlier_rate(usd_amount, lbp_amount, usd_to_lbp):
-    #get the recent average rate for comparison
-    end_date = datetime.datetime.now()
-    start_date = end_date - datetime.timedelta(hours=72)
-    recent_txns = Transaction.query.filter(
-        Transaction.added_date.between(start_date, end_date),
-        Transaction.usd_to_lbp == usd_to_lbp,
-        Transaction.is_outlier == False
-    ).all()
-
-    if not recent_txns:
+    #get the recent average rate (outliers excluded) for comparison
+    avg_rate = rate_engine.rate(usd_to_lbp)
+
+    if avg_rate is None:
         return False  #in case there is no baseline to compare against
 
-    avg_rate = sum(t.lbp_amount / t.usd_amount for t in recent_txns) / len(recent_txns)
     new_rate = lbp_amount / usd_amount
     deviation = abs(new_rate - avg_rate) / avg_rate
 
@@ -60,13 +50,10 @@ def add_transaction():
     if source not in ['internal', 'external']:
         return jsonify({"error": "source must be 'internal' or 'external'"}), 400
     
-    token = extract_auth_token(request)
-    if token:
-        try:
-            user_id=decode_token(token)
-            
-        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-            abort(403)
+    #the token is optional here, but a bad one is still rejected
+    if g.invalid_token:
+        abort(403)
+    user_id = g.user_id
 
     #check if this transac is an outlier
     outlier = is_outlier_rate(usd_amount, lbp_amount, usd_to_lbp)
@@ -74,13 +61,27 @@ def add_transaction():
     transaction.is_outlier = outlier  # just flag it
     try:
         db.session.add(transaction)
+        apply_transaction(db.session, transaction)
+        increment_rate_counter(db.session, transaction)
+        if user_id:
+            record_user_activity(db.session, user_id, transactions=1, usd_volume=usd_amount)
         db.session.commit()
-        log_event('TRANSACTION_CREATED', f"Transaction created: {usd_amount} USD / {lbp_amount} LBP", user_id=user_id)
-        check_and_notify(db.session)
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": "Transaction failed, please try again"}), 500
 
+    #the trade is committed from here on: if one of these in-memory updates fails we log it, the client still gets
+    #the response that matches the db (the rate engine and the caches catch up on their next sync/expiry anyway)
+    try:
+        rate_engine.record(transaction)
+        response_cache.bump()#the cached rate/analytics/history responses are stale now
+        log_event('TRANSACTION_CREATED', f"Transaction created: {usd_amount} USD / {lbp_amount} LBP", user_id=user_id)
+    except Exception:
+        current_app.logger.exception(f"Post-commit update failed for transaction {transaction.id}")
+
+    #alerts are evaluated in the background so they dont slow down (or roll back) the trade
+    alert_worker.submit()
+
     if outlier:
         return jsonify({
             "warning": "Transaction saved but flagged as outlier: rate deviates significantly from recent average",
@@ -96,68 +97,69 @@ def add_transaction():
 
 @transactions_bp.route('/transaction', methods=['GET'])
 def get_user_transactions():
-    token= extract_auth_token(request)
-    if not token:
-        abort(403)
-
-    try:
-        user_id = decode_token(token)
-    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-        abort(403)
-    user_transactions= Transaction.query.filter_by(user_id=user_id).all()
-    return jsonify(transactions_schema.dump(user_transactions))
+    user_id = get_current_user(403)
+    user_transactions, next_cursor = paginate(Transaction.query.filter_by(user_id=user_id), Transaction.added_date, Transaction.id)
+    return paginated_response(transactions_schema.dump(user_transactions), next_cursor)
 
 @transactions_bp.route('/exchangeRate', methods=['GET'])
+@response_cache.cached
 def get_exchange_rate():
-    end_date = datetime.datetime.now()
-    start_date = end_date - datetime.timedelta(hours=72)
-    
-    usd_to_lbp_transactions = Transaction.query.filter(
-        Transaction.added_date.between(start_date, end_date),
-        Transaction.usd_to_lbp == True,
-        Transaction.is_outlier == False  #exclude outliers (extreme transactions) so they dont ruin the avg rate
-    ).all()
-
-    lbp_to_usd_transactions = Transaction.query.filter(
-        Transaction.added_date.between(start_date, end_date),
-        Transaction.usd_to_lbp == False,
-        Transaction.is_outlier == False#also exclude outliers
-    ).all()
-
-    avg_usd_to_lbp = None
-    if usd_to_lbp_transactions:
-        avg_usd_to_lbp = sum([txn.lbp_amount / txn.usd_amount for txn in usd_to_lbp_transactions]) / len(usd_to_lbp_transactions)
-
-    avg_lbp_to_usd = None
-    if lbp_to_usd_transactions:
-        avg_lbp_to_usd = sum([txn.lbp_amount / txn.usd_amount for txn in lbp_to_usd_transactions]) / len(lbp_to_usd_transactions)
+    #average of the last 72 hours, outliers excluded so they dont ruin the avg rate (kept up to date by the rate engine)
+    avg_usd_to_lbp, avg_lbp_to_usd = rate_engine.rates()
     return jsonify({"usd_to_lbp_rate": avg_usd_to_lbp, "lbp_to_usd_rate": avg_lbp_to_usd})
 
 #export transaction history as csv
 @transactions_bp.route('/export', methods=['GET'])
 def export_transaction_history():
     user_id=get_current_user()
+    start_str = request.args.get('start_date')
+    end_str = request.args.get('end_date')
+    compress = request.args.get('gzip', 'false').lower() == 'true'
 
-    transactions = Transaction.query.filter_by(user_id=user_id).order_by(Transaction.added_date.desc()).all()# now we order by desc() to put the newest transactions first, if we wanna do it the opposite way just use asc() instead
-
-    if not transactions:
+    query = Transaction.query.filter_by(user_id=user_id)
+    #optional date range, same format as the analytics endpoints
+    try:
+        if start_str:
+            query = query.filter(Transaction.added_date >= datetime.datetime.strptime(start_str, "%m/%d/%Y"))
+        if end_str:
+            query = query.filter(Transaction.added_date <= datetime.datetime.strptime(end_str, "%m/%d/%Y").replace(hour=23, minute=59, second=59))
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use: MM/DD/YYYY"}), 400
+
+    if not query.with_entities(Transaction.id).first():
         return jsonify({"message": "No transactions found to export"}), 200
-    
-    #create in memory string buffer to write the csv into (we dont create a real file in the server filesystem, just a fake file that lives in Ram instead of disk)
-    output = io.StringIO()
-    #python's built in csv writer , handles proper formatting
-    writer = csv.writer(output)
-    #write the first row (the col names)
-    writer.writerow(['id', 'usd_amount', 'lbp_amount', 'usd_to_lbp', 'added_date'])
-    #write one row per transac
-    for txn in transactions:
-        writer.writerow([txn.id,txn.usd_amount,txn.lbp_amount,txn.usd_to_lbp,txn.added_date])
-
-    #build HTTP response with the csv content
-    output.seek(0)#move the buffer's cursor back to the start 
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = 'attachment; filename=transactions.csv'
-    return response
-
 
+    rows = query.with_entities(
+        Transaction.id,
+        Transaction.usd_amount,
+        Transaction.lbp_amount,
+        Transaction.usd_to_lbp,
+        Transaction.added_date
+    ).order_by(Transaction.added_date.desc(), Transaction.id.desc()).yield_per(export_batch_size)# now we order by desc() to put the newest transactions first, if we wanna do it the opposite way just use asc() instead
+
+    def generate_csv():
+        #instead of building the whole file in ram, we write a batch of rows into a small buffer, send it, and empty it
+        #(yield_per makes the db send the rows in batches too, so memory stays the same however long the history is)
+        output = io.StringIO()
+        writer = csv.writer(output)
+        #write the first row (the col names), it goes out right away
+        writer.writerow(['id', 'usd_amount', 'lbp_amount', 'usd_to_lbp', 'added_date'])
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate(0)
+        #write one row per transac
+        for i, txn in enumerate(rows, start=1):
+            writer.writerow([txn.id, txn.usd_amount, txn.lbp_amount, txn.usd_to_lbp, txn.added_date])
+            if i % export_batch_size == 0:
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate(0)
+        yield output.getvalue()
+
+    if compress:
+        response = Response(stream_with_context(gzip_stream(generate_csv())), mimetype='application/gzip')
+        response.headers['Content-Disposition'] = 'attachment; filename=transactions.csv.gz'
+    else:
+        response = Response(stream_with_context(generate_csv()), mimetype='text/csv')
+        response.headers['Content-Disposition'] = 'attachment; filename=transactions.csv'
+    return response
@@ -1,20 +1,11 @@
-from flask import Blueprint, request, jsonify, abort
-import jwt
+from flask import Blueprint, request, jsonify
 from extensions import db
 from model.watchlist import WatchlistItem, watchlist_item_schema, watchlist_items_schema
-from service.auth_service import extract_auth_token, decode_token
+from service.auth_service import get_current_user
+from service.pagination import paginate, paginated_response
 
 watchlist_bp = Blueprint('watchlist', __name__)
 
-def get_current_user():
-    token = extract_auth_token(request)
-    if not token:
-        abort(401)
-    try:
-        return decode_token(token)
-    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-        abort(401)
-
 #add watchlist item
 @watchlist_bp.route('/watchlist', methods=['POST'])
 def add_to_watchlist():
@@ -45,8 +36,8 @@ def add_to_watchlist():
 @watchlist_bp.route('/watchlist', methods=['GET'])
 def get_watchlist():
     user_id=get_current_user()
-    watchlist_items=WatchlistItem.query.filter_by(user_id=user_id).order_by(WatchlistItem.created_at.desc()).all()
-    return jsonify (watchlist_items_schema.dump(watchlist_items))
+    watchlist_items, next_cursor = paginate(WatchlistItem.query.filter_by(user_id=user_id), WatchlistItem.created_at, WatchlistItem.id)
+    return paginated_response(watchlist_items_schema.dump(watchlist_items), next_cursor)
 
 #delet item from watchlist
 @watchlist_bp.route('/watchlist/<int:item_id>', methods=['DELETE'])
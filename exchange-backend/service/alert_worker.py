@@ -0,0 +1,77 @@
+import atexit
+import queue
+import threading
+import time
+from extensions import db
+from service.notification_service import check_and_notify
+
+class AlertWorker:
+    #runs check_and_notify in a background thread instead of inside the request, write routes just call submit().
+    #a burst of submits during one tick is coalesced into a single evaluation
+    def __init__(self, tick=0.5):
+        self.tick = tick
+        self.sync = False  #local stand-in: evaluate right away in the caller's session (handy for tests/debugging)
+        self.app = None
+        self.submitted = 0
+        self.evaluations = 0
+        self.failures = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.tick = app.config.get('ALERT_WORKER_TICK', self.tick)
+        self.sync = app.config.get('ALERT_WORKER_SYNC', self.sync)
+        atexit.register(self.drain)
+
+    def submit(self):
+        self.submitted += 1
+        if self.sync:
+            self._evaluate()
+            return
+        self._start()
+        self._queue.put(None)
+
+    def _start(self):
+        #started lazily so every gunicorn worker gets its own thread after the fork
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='alert-worker', daemon=True)
+                self._thread.start()
+
+    def _take_all(self):
+        #empty the queue, returns whether anything was waiting in it
+        pending = False
+        while True:
+            try:
+                self._queue.get_nowait()
+                pending = True
+            except queue.Empty:
+                return pending
+
+    def _run(self):
+        while True:
+            self._queue.get()
+            time.sleep(self.tick)  #let the rest of the burst arrive
+            self._take_all()
+            with self.app.app_context():
+                self._evaluate()
+
+    def _evaluate(self):
+        try:
+            check_and_notify(db.session)
+            db.session.commit()
+            self.evaluations += 1
+        except Exception:
+            db.session.rollback()
+            self.failures += 1
+            self.app.logger.exception("Alert evaluation failed")
+
+    def drain(self):
+        #at shutdown, run the evaluation that is still waiting in the queue (if any)
+        if self.app is not None and self._take_all():
+            with self.app.app_context():
+                self._evaluate()
+
+alert_worker = AlertWorker()
@@ -1,11 +1,109 @@
+import atexit
+import datetime
+import threading
+from sqlalchemy import insert
 from extensions import db
 from model.audit_log import AuditLog
 
+class AuditSink:
+    #write-behind buffer for audit events: log_event only appends to memory, and a background thread writes
+    #the buffer with one bulk insert when it reaches flush_size events or every flush_interval seconds
+    def __init__(self, flush_size=100, flush_interval=2.0, max_buffer=10000):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer  #past this we drop events instead of growing forever (if the db is down for example)
+        self.sync = False  #write every event right away, for tests
+        self.app = None
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.max_delay = 0.0  #longest time (seconds) an event waited in the buffer before being written
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        self.app = app
+        self.flush_size = app.config.get('AUDIT_FLUSH_SIZE', self.flush_size)
+        self.flush_interval = app.config.get('AUDIT_FLUSH_INTERVAL', self.flush_interval)
+        self.max_buffer = app.config.get('AUDIT_MAX_BUFFER', self.max_buffer)
+        self.sync = app.config.get('AUDIT_SYNC', self.sync)
+        atexit.register(self.flush)
+
+    def add(self, event_type, description, user_id=None):
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self.dropped += 1
+                return
+            self._buffer.append({
+                "event_type": event_type,
+                "description": description,
+                "user_id": user_id,
+                "timestamp": datetime.datetime.now()
+            })
+            full = len(self._buffer) >= self.flush_size
+        if self.sync:
+            self.flush()
+            return
+        self._start()
+        if full:
+            self._wakeup.set()
+
+    def _start(self):
+        #started lazily so every gunicorn worker gets its own thread after the fork
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='audit-sink', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        #one bulk insert for everything in the buffer, on its own connection so it never commits someone else's session
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+            if not rows or self.app is None:
+                return
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as connection:
+                        connection.execute(insert(AuditLog), rows)
+            except Exception:
+                self.failed_flushes += 1
+                self.app.logger.exception("Audit log flush failed")
+                with self._lock:
+                    #put the events back in front for the next flush, keeping at most max_buffer of them
+                    room = max(self.max_buffer - len(self._buffer), 0)
+                    self.dropped += max(len(rows) - room, 0)
+                    self._buffer = rows[:room] + self._buffer
+                return
+            self.flushes += 1
+            self.written += len(rows)
+            self.max_delay = max(self.max_delay, (datetime.datetime.now() - rows[0]["timestamp"]).total_seconds())
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._buffer)
+            oldest = self._buffer[0]["timestamp"] if self._buffer else None
+        return {
+            "pending": pending,
+            "oldest_pending_seconds": round((datetime.datetime.now() - oldest).total_seconds(), 3) if oldest else 0,
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "max_delay_seconds": round(self.max_delay, 3)
+        }
+
+audit_sink = AuditSink()
+
 def log_event(event_type, description, user_id=None):
-    log = AuditLog(
-        event_type=event_type,
-        description=description,
-        user_id=user_id
-    )
-    db.session.add(log)
-    db.session.commit()
\ No newline at end of file
+    audit_sink.add(event_type, description, user_id=user_id)
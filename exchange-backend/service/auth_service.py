@@ -1,14 +1,31 @@
+from flask import request, g, abort, jsonify, make_response
+from collections import OrderedDict
 import jwt
 import datetime
+import hashlib
+import threading
+import time
 import os
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 
-def create_token(user_id):
+#how long (in seconds) a user's role/status is trusted before we read it again. other workers only see a change
+#after this, the worker that made the change drops it right away
+PRINCIPAL_CACHE_TTL = 30
+
+#how many verified tokens we keep, and for how long (in seconds) at most, even if the token itself lives longer
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL = 300
+
+def create_token(user_id, role='USER', status='active'):
+    #role and status are only informative for the client (they are the values at login time),
+    #the server always checks them through principal_cache
     payload = {
         'exp': datetime.datetime.utcnow() + datetime.timedelta(days=4),
         'iat': datetime.datetime.utcnow(),
-        'sub': str(user_id)
+        'sub': str(user_id),
+        'role': role,
+        'status': status
     }
     token = jwt.encode(payload, SECRET_KEY, algorithm="HS256")
     return token.decode("utf-8") if isinstance(token, bytes) else token
@@ -16,10 +33,135 @@ def create_token(user_id):
 def extract_auth_token(authenticated_request):
     auth_header = authenticated_request.headers.get('Authorization')
     if auth_header:
-        return auth_header.split(" ")[1]
+        parts = auth_header.split(" ")
+        return parts[1] if len(parts) > 1 else None  #a header without "Bearer <token>" counts as no token
     else:
         return None
 
+class TokenCache:
+    #LRU of tokens whose signature we already verified, so the frontend's bursts of calls with the same token only
+    #pay for the HS256 check once. keyed by the sha256 of the token (we dont keep raw tokens around), and an entry
+    #never outlives the token's own exp
+    def __init__(self, size=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  #digest -> (user_id, expires_at)
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.size = app.config.get('TOKEN_CACHE_SIZE', TOKEN_CACHE_SIZE)
+        self.ttl = app.config.get('TOKEN_CACHE_TTL', TOKEN_CACHE_TTL)
+        #every request decodes its token once here, route handlers then read the user from flask.g
+        app.before_request(load_principal)
+
+    def _digest(self, token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        key = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token, user_id, exp):
+        key = self._digest(token)
+        expires_at = min(exp, time.time() + self.ttl)
+        with self._lock:
+            self._entries[key] = (user_id, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+token_cache = TokenCache()
+
 def decode_token(token):
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
     payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-    return int(payload['sub'])
+    user_id = int(payload['sub'])
+    token_cache.put(token, user_id, payload['exp'])
+    return user_id
+
+class PrincipalCache:
+    #user_id -> (role, status), so admin checks and the suspended/banned check on every request dont hit the db
+    def __init__(self, ttl=PRINCIPAL_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}  #user_id -> (role, status, expires_at)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('PRINCIPAL_CACHE_TTL', PRINCIPAL_CACHE_TTL)
+
+    def get(self, user_id):
+        #returns (role, status), or None if the user doesnt exist
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is not None and entry[2] > time.time():
+            return entry[0], entry[1]
+        from model.user import User
+        from extensions import db
+        row = db.session.query(User.role, User.status).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        with self._lock:
+            self._entries[user_id] = (row.role, row.status, time.time() + self.ttl)
+        return row.role, row.status
+
+    def invalidate(self, user_id):
+        #call after changing a user's role or status
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+principal_cache = PrincipalCache()
+
+def load_principal():
+    #before_request hook: g.user_id is the caller (None if anonymous), g.invalid_token is set when a token was sent but
+    #didnt verify (expired, bad signature...)
+    g.user_id = None
+    g.role = None
+    g.invalid_token = False
+    token = extract_auth_token(request)
+    if not token:
+        return
+    try:
+        user_id = decode_token(token)
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        g.invalid_token = True
+        return
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        g.invalid_token = True  #the user was deleted since the token was issued
+        return
+    role, status = principal
+    #a suspended or banned user is blocked on every route, not only at login
+    if status in ['suspended', 'banned']:
+        abort(make_response(jsonify({"error": f"Account is {status}"}), 403))
+    g.user_id, g.role = user_id, role
+
+def get_current_user(error_code=401):
+    #the user id of the caller, or abort with error_code (401 by default) if there is no valid token
+    user_id = g.get('user_id')
+    if user_id is None:
+        abort(error_code)
+    return user_id
+
+def require_admin():
+    #the user id of the caller, abort 401 without a valid token and 403 if the caller isnt an admin
+    user_id = get_current_user()
+    if g.role != 'ADMIN':
+        abort(403)
+    return user_id
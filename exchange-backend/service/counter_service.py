@@ -0,0 +1,112 @@
+import click
+import datetime
+from flask.cli import with_appcontext
+from sqlalchemy import func, update, insert
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from model.rate_counter import RateCounter
+from model.user_activity import UserActivity
+from model.transaction import Transaction
+from model.offer import Offer
+
+def increment_rate_counter(session, transaction):
+    #UPDATE ... SET x = x + ? runs in the db, so concurrent inserts from several workers cant overwrite each other.
+    #the caller commits together with the transaction itself
+    rate = transaction.lbp_amount / transaction.usd_amount
+    stmt = update(RateCounter).where(RateCounter.usd_to_lbp == transaction.usd_to_lbp).values(
+        transaction_count=RateCounter.transaction_count + 1,
+        rate_sum=RateCounter.rate_sum + rate
+    )
+    if session.execute(stmt).rowcount:
+        return
+    try:
+        #first transaction of this direction: savepoint, so if another worker created the row in the meantime we only lose this insert
+        with session.begin_nested():
+            session.add(RateCounter(transaction.usd_to_lbp, 1, rate))
+    except IntegrityError:
+        session.execute(stmt)
+
+def aggregate_rate_counters(session):
+    #the same numbers computed from the transaction table, to rebuild or check the counters
+    rows = session.query(
+        Transaction.usd_to_lbp,
+        func.count(Transaction.id),
+        func.sum(Transaction.lbp_amount / Transaction.usd_amount)
+    ).group_by(Transaction.usd_to_lbp).all()
+    return {bool(usd_to_lbp): (count, rate_sum or 0.0) for usd_to_lbp, count, rate_sum in rows}
+
+def rebuild_rate_counters(session):
+    #recompute the counters from scratch (after a restore, or if they are ever out of sync), the caller commits
+    totals = aggregate_rate_counters(session)
+    session.query(RateCounter).delete()
+    for usd_to_lbp, (count, rate_sum) in totals.items():
+        session.add(RateCounter(usd_to_lbp, count, rate_sum))
+    return totals
+
+def record_user_activity(session, user_id, transactions=0, offers_posted=0, offers_accepted=0, usd_volume=0):
+    #same idea as increment_rate_counter, for the per user activity counters. the caller commits
+    now = datetime.datetime.now()
+    stmt = update(UserActivity).where(UserActivity.user_id == user_id).values(
+        transaction_count=UserActivity.transaction_count + transactions,
+        offers_posted=UserActivity.offers_posted + offers_posted,
+        offers_accepted=UserActivity.offers_accepted + offers_accepted,
+        usd_volume=UserActivity.usd_volume + usd_volume,
+        last_active_at=now
+    )
+    if session.execute(stmt).rowcount:
+        return
+    try:
+        with session.begin_nested():
+            session.add(UserActivity(user_id, transactions, offers_posted, offers_accepted, usd_volume, now))
+    except IntegrityError:
+        session.execute(stmt)
+
+def rebuild_user_activity(session, batch_size=5000):
+    #recompute every user's counters with one grouped query per source table, the caller commits
+    activity = {}
+    def entry(user_id):
+        return activity.setdefault(user_id, {
+            "user_id": user_id,
+            "transaction_count": 0,
+            "offers_posted": 0,
+            "offers_accepted": 0,
+            "usd_volume": 0.0,
+            "last_active_at": None
+        })
+    def touch(row, date):
+        if date and (row["last_active_at"] is None or date > row["last_active_at"]):
+            row["last_active_at"] = date
+
+    for user_id, count, usd_volume, last_date in session.query(
+        Transaction.user_id, func.count(Transaction.id), func.sum(Transaction.usd_amount), func.max(Transaction.added_date)
+    ).filter(Transaction.user_id != None).group_by(Transaction.user_id):
+        row = entry(user_id)
+        row["transaction_count"], row["usd_volume"] = count, usd_volume or 0.0
+        touch(row, last_date)
+    for user_id, count, last_date in session.query(
+        Offer.user_id, func.count(Offer.id), func.max(Offer.creation_date)
+    ).group_by(Offer.user_id):
+        row = entry(user_id)
+        row["offers_posted"] = count
+        touch(row, last_date)
+    for user_id, count, last_date in session.query(
+        Offer.accepted_by, func.count(Offer.id), func.max(Offer.accepted_at)
+    ).filter(Offer.status == 'accepted', Offer.accepted_by != None).group_by(Offer.accepted_by):
+        row = entry(user_id)
+        row["offers_accepted"] = count
+        touch(row, last_date)
+
+    session.query(UserActivity).delete()
+    rows = list(activity.values())
+    for i in range(0, len(rows), batch_size):
+        session.execute(insert(UserActivity), rows[i:i + batch_size])
+    return len(rows)
+
+#flask --app app rebuild-counters
+@click.command('rebuild-counters')
+@with_appcontext
+def rebuild_counters_command():
+    totals = rebuild_rate_counters(db.session)
+    users = rebuild_user_activity(db.session)
+    db.session.commit()
+    click.echo(f"Rebuilt rate counters from {sum(count for count, _ in totals.values())} transactions and activity counters of {users} users")
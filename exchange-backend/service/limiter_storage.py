@@ -0,0 +1,136 @@
+import os
+import sqlite3
+import threading
+import time
+from math import floor
+from limits.storage import Storage
+from limits.storage.base import SlidingWindowCounterSupport, TimestampedSlidingWindow
+
+#how often (in seconds) expired counters are deleted from the file
+CLEANUP_INTERVAL_SECONDS = 60
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    #rate limit counters in a sqlite file, so every gunicorn worker on the host shares the same limits without running
+    #redis/memcached. registers the sqlite:// scheme with the limits package. the path follows sqlalchemy's sqlite urls:
+    #"sqlite:////tmp/exchange-ratelimit.db" (absolute), "sqlite:///ratelimit.db" (relative to the working directory),
+    #"sqlite:///C:/Temp/ratelimit.db" on windows, "sqlite://" in memory. each check is one short write in WAL mode
+    #(one upsert, no fsync per write)
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = uri[len("sqlite:///"):] if uri.startswith("sqlite:///") else ":memory:"
+        self.timeout = float(options.get('timeout', 5))
+        self._local = threading.local()
+        self._last_cleanup = 0
+        self._execute("""
+            CREATE TABLE IF NOT EXISTS rate_limit_counter (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self):
+        #one connection per thread, and a new one after a fork (sqlite connections cant be shared across processes)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _execute(self, sql, params=()):
+        return self._connection().execute(sql, params)
+
+    def _cleanup(self, now):
+        if now - self._last_cleanup < CLEANUP_INTERVAL_SECONDS:
+            return
+        self._last_cleanup = now
+        self._execute("DELETE FROM rate_limit_counter WHERE expires_at <= ?", (now,))
+
+    def incr(self, key, expiry, amount=1):
+        #a single upsert, so two workers incrementing the same key cant lose a hit. an expired counter restarts from 0
+        now = time.time()
+        self._cleanup(now)
+        return self._execute("""
+            INSERT INTO rate_limit_counter (key, value, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                value = CASE WHEN expires_at <= ? THEN excluded.value ELSE value + excluded.value END,
+                expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END
+            RETURNING value
+        """, (key, amount, now + expiry, now, now)).fetchone()[0]
+
+    def get(self, key):
+        row = self._execute(
+            "SELECT value FROM rate_limit_counter WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        now = time.time()
+        row = self._execute(
+            "SELECT expires_at FROM rate_limit_counter WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        return row[0] if row else now
+
+    def check(self):
+        try:
+            self._execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return self._execute("DELETE FROM rate_limit_counter").rowcount
+
+    def clear(self, key):
+        self._execute("DELETE FROM rate_limit_counter WHERE key = ?", (key,))
+
+    def _window(self, previous_key, current_key, expiry, now):
+        rows = dict(self._execute(
+            "SELECT key, value FROM rate_limit_counter WHERE key IN (?, ?) AND expires_at > ?",
+            (previous_key, current_key, now)
+        ).fetchall())
+        previous_count = rows.get(previous_key, 0)
+        current_count = rows.get(current_key, 0)
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        #sliding window counter: the previous window counts in proportion to how much of it is still inside the
+        #window. the read and the increment run in one write transaction, so concurrent workers cant both take the
+        #last slot
+        if amount > limit:
+            return False
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            previous_count, previous_ttl, current_count, _ = self._window(previous_key, current_key, expiry, now)
+            allowed = floor(previous_count * previous_ttl / expiry + current_count) + amount <= limit
+            if allowed:
+                self.incr(current_key, 2 * expiry, amount)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return allowed
+
+    def get_sliding_window(self, key, expiry):
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        return self._window(previous_key, current_key, expiry, now)
+
+    def clear_sliding_window(self, key, expiry):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, time.time())
+        self.clear(previous_key)
+        self.clear(current_key)
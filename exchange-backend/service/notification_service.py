@@ -1,45 +1,74 @@
-from extensions import db
 from model.notification import Notification
 from model.alert import Alert
-from model.transaction import Transaction
-import datetime
+from service.rate_engine import rate_engine
 
-def check_and_notify(session):
-    # recompute the current exchange rates from last 72 hours
-    end_date = datetime.datetime.now()
-    start_date = end_date - datetime.timedelta(hours=72)
-
-    usd_to_lbp_txns = Transaction.query.filter(
-        Transaction.added_date.between(start_date, end_date),
-        Transaction.usd_to_lbp == True
+def find_triggered_alerts(usd_to_lbp, current_rate):
+    # armed alerts that the rate just crossed: "above" alerts with a threshold below the rate, "below" alerts with one above it
+    above = Alert.query.filter(
+        Alert.usd_to_lbp == usd_to_lbp,
+        Alert.direction == 'above',
+        Alert.state == 'armed',
+        Alert.threshold < current_rate
+    ).all()
+    below = Alert.query.filter(
+        Alert.usd_to_lbp == usd_to_lbp,
+        Alert.direction == 'below',
+        Alert.state == 'armed',
+        Alert.threshold > current_rate
     ).all()
+    return above + below
 
-    lbp_to_usd_txns = Transaction.query.filter(
-        Transaction.added_date.between(start_date, end_date),
-        Transaction.usd_to_lbp == False
+def find_rearmed_alerts(usd_to_lbp, current_rate):
+    # fired alerts that the rate moved back past, by at least their rearm margin
+    above = Alert.query.filter(
+        Alert.usd_to_lbp == usd_to_lbp,
+        Alert.direction == 'above',
+        Alert.state == 'fired',
+        Alert.threshold >= current_rate,
+        Alert.threshold - Alert.rearm_margin >= current_rate
     ).all()
+    below = Alert.query.filter(
+        Alert.usd_to_lbp == usd_to_lbp,
+        Alert.direction == 'below',
+        Alert.state == 'fired',
+        Alert.threshold <= current_rate,
+        Alert.threshold + Alert.rearm_margin <= current_rate
+    ).all()
+    return above + below
+
+def claim_alert(session, alert, from_state, to_state, current_rate):
+    # moves the alert to its new state with a single conditional UPDATE ... WHERE id=? AND state=?, so when several
+    # workers evaluate the same crossing only one of them changes the row (the others get rowcount 0). returns True if
+    # this worker won
+    claimed = session.query(Alert).filter(
+        Alert.id == alert.id,
+        Alert.state == from_state
+    ).update({"state": to_state, "last_rate": current_rate}, synchronize_session=False)
+    return claimed == 1
 
-    avg_usd_to_lbp = sum(t.lbp_amount / t.usd_amount for t in usd_to_lbp_txns) / len(usd_to_lbp_txns) if usd_to_lbp_txns else None
-    avg_lbp_to_usd = sum(t.lbp_amount / t.usd_amount for t in lbp_to_usd_txns) / len(lbp_to_usd_txns) if lbp_to_usd_txns else None
+def check_and_notify(session):
+    # current exchange rates over the last 72 hours (outliers included), from the rate engine
+    avg_usd_to_lbp, avg_lbp_to_usd = rate_engine.rates(include_outliers=True)
 
-    # check all the alert in the system
-    all_alerts = Alert.query.all()
-    for alert in all_alerts:
-        current_rate = avg_usd_to_lbp if alert.usd_to_lbp else avg_lbp_to_usd
+    # alerts are edge triggered: we only notify when the rate crosses the threshold (armed -> fired), and the alert
+    # has to be re-armed (rate back on the other side) before it can notify again. each lookup is a range query on
+    # the (usd_to_lbp, direction, state, threshold) index, so we never load every alert in the system. the
+    # transitions are claimed with claim_alert, so an alert only notifies once even with several workers
+    for usd_to_lbp, current_rate in ((True, avg_usd_to_lbp), (False, avg_lbp_to_usd)):
         if current_rate is None:
             continue
-        is_triggered = (
-            (alert.direction == 'above' and current_rate > alert.threshold) or
-            (alert.direction == 'below' and current_rate < alert.threshold)
-        )
-        if is_triggered:
+        for alert in find_triggered_alerts(usd_to_lbp, current_rate):
+            if not claim_alert(session, alert, 'armed', 'fired', current_rate):
+                continue  # another worker fired it first
             notification = Notification(
                 user_id=alert.user_id,
                 title="Alert Triggered",
                 message=f"Your alert #{alert.id} was triggered: rate is {round(current_rate, 2)}, threshold was {alert.direction} {alert.threshold}"
             )
             session.add(notification)
-    session.commit()
+        for alert in find_rearmed_alerts(usd_to_lbp, current_rate):
+            claim_alert(session, alert, 'fired', 'armed', current_rate)
+    # no commit here: the caller commits everything in one go
 
 def send_notification(session, user_id, title, message):
     notification = Notification(
@@ -47,5 +76,4 @@ def send_notification(session, user_id, title, message):
         title=title,
         message=message
     )
-    session.add(notification)
-    session.commit()
\ No newline at end of file
+    session.add(notification)
\ No newline at end of file
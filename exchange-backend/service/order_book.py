@@ -0,0 +1,150 @@
+import bisect
+import datetime
+import threading
+from extensions import db
+from model.offer import Offer
+
+#how often (in seconds) we pick up the offers other workers created/accepted/canceled
+SYNC_INTERVAL_SECONDS = 5
+#how far back (in seconds) each sync looks again, for writes that committed a little after the updated_at they set
+#(or with a worker clock a little behind ours)
+SYNC_SLACK_SECONDS = 60
+
+class OrderBook:
+    #available offers kept in memory, sorted by implied rate (lbp_amount / usd_amount, in LBP per USD):
+    # - usd_to_lbp offers sell USD (asks): best ask = lowest rate
+    # - lbp_to_usd offers buy USD (bids): best bid = highest rate
+    #the db is still the source of truth: acceptance always goes through the offer table, the book only serves
+    #snapshots and finds match candidates
+    def __init__(self, sync_interval=SYNC_INTERVAL_SECONDS, sync_slack=SYNC_SLACK_SECONDS):
+        self.sync_interval = datetime.timedelta(seconds=sync_interval)
+        self.sync_slack = datetime.timedelta(seconds=sync_slack)
+        self._lock = threading.Lock()
+        self._last_sync = None
+        self._asks = []  #sorted keys (rate, creation_date, id)
+        self._bids = []  #sorted keys (-rate, creation_date, id) so the best bid is first too
+        self._offers = {}  #id -> (key, usd_to_lbp, usd_amount, lbp_amount, user_id)
+
+    def _side(self, usd_to_lbp):
+        return self._asks if usd_to_lbp else self._bids
+
+    def _insert(self, offer):
+        if offer.id in self._offers:
+            return
+        rate = offer.lbp_amount / offer.usd_amount
+        key = (rate if offer.usd_to_lbp else -rate, offer.creation_date or datetime.datetime.min, offer.id)
+        bisect.insort(self._side(offer.usd_to_lbp), key)
+        self._offers[offer.id] = (key, offer.usd_to_lbp, offer.usd_amount, offer.lbp_amount, offer.user_id)
+
+    def _delete(self, offer_id):
+        entry = self._offers.pop(offer_id, None)
+        if entry is None:
+            return
+        side = self._side(entry[1])
+        i = bisect.bisect_left(side, entry[0])
+        if i < len(side) and side[i] == entry[0]:
+            del side[i]
+
+    def _rows(self, *conditions):
+        #plain rows with only the columns the book needs, no orm objects
+        return db.session.query(
+            Offer.id,
+            Offer.user_id,
+            Offer.usd_amount,
+            Offer.lbp_amount,
+            Offer.usd_to_lbp,
+            Offer.creation_date,
+            Offer.status
+        ).filter(*conditions).all()
+
+    def rebuild(self):
+        #load every available offer from the db (on first use, or after reset)
+        now = datetime.datetime.now()
+        offers = self._rows(Offer.status == 'available')
+        with self._lock:
+            self._asks, self._bids, self._offers = [], [], {}
+            for offer in offers:
+                self._insert(offer)
+            self._last_sync = now
+
+    def _sync(self, now):
+        #only the offers written since the last sync (minus the slack): updated_at is set on every write, so this sees
+        #the new offers and the accepted/canceled ones without reloading the whole book
+        offers = self._rows(Offer.updated_at >= self._last_sync - self.sync_slack)
+        with self._lock:
+            for offer in offers:
+                if offer.status == 'available':
+                    self._insert(offer)
+                else:
+                    self._delete(offer.id)
+            self._last_sync = now
+
+    def _refresh(self):
+        now = datetime.datetime.now()
+        if self._last_sync is None:
+            self.rebuild()
+        elif now - self._last_sync >= self.sync_interval:
+            self._sync(now)
+
+    def reset(self):
+        #forget everything, the next read reloads the book (after a restore, whose rows keep their old updated_at)
+        with self._lock:
+            self._last_sync = None
+
+    def add(self, offer):
+        with self._lock:
+            if self._last_sync is not None:
+                self._insert(offer)
+
+    def remove(self, offer_id):
+        with self._lock:
+            self._delete(offer_id)
+
+    def _level(self, key):
+        entry = self._offers[key[2]]
+        return {"offer_id": key[2], "rate": round(abs(key[0]), 4), "usd_amount": entry[2], "lbp_amount": entry[3]}
+
+    def snapshot(self, depth=10):
+        #best bid/ask plus the first `depth` price levels of each side (offers at the same rate are summed up)
+        self._refresh()
+        with self._lock:
+            sides = {}
+            for name, side in (("bids", self._bids), ("asks", self._asks)):
+                levels = []
+                for key in side:
+                    rate = round(abs(key[0]), 4)
+                    usd_amount = self._offers[key[2]][2]
+                    if levels and levels[-1]["rate"] == rate:
+                        levels[-1]["usd_amount"] += usd_amount
+                        levels[-1]["offer_count"] += 1
+                        continue
+                    if len(levels) == depth:
+                        break
+                    levels.append({"rate": rate, "usd_amount": usd_amount, "offer_count": 1})
+                sides[name] = levels
+            best_bid = self._level(self._bids[0]) if self._bids else None
+            best_ask = self._level(self._asks[0]) if self._asks else None
+        return {
+            "best_bid": best_bid,
+            "best_ask": best_ask,
+            "spread": round(best_ask["rate"] - best_bid["rate"], 4) if best_bid and best_ask else None,
+            **sides
+        }
+
+    def find_match(self, usd_to_lbp, usd_amount, lbp_amount, user_id):
+        #best resting offer on the opposite side whose rate is at least as good as ours and that trades the same usd amount
+        #(offers are filled whole, there are no partial fills). returns its id or None
+        self._refresh()
+        rate = lbp_amount / usd_amount
+        with self._lock:
+            for key in self._side(not usd_to_lbp):
+                other_rate = abs(key[0])
+                #a seller (usd_to_lbp) can take bids at or above its rate, a buyer can take asks at or below it
+                if (usd_to_lbp and other_rate < rate) or (not usd_to_lbp and other_rate > rate):
+                    return None
+                entry = self._offers[key[2]]
+                if entry[2] == usd_amount and entry[4] != user_id:
+                    return key[2]
+        return None
+
+order_book = OrderBook()
@@ -0,0 +1,66 @@
+from flask import request, jsonify, abort, make_response
+import base64
+import datetime
+import json
+from extensions import db
+
+DEFAULT_PAGE_SIZE = 100  #what old clients that dont send a limit get
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(values):
+    values = [v.isoformat() if isinstance(v, datetime.datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor, columns):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if len(values) != len(columns):
+            raise ValueError
+        return [
+            datetime.datetime.fromisoformat(v) if v is not None and isinstance(c.type, db.DateTime) else v
+            for c, v in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        abort(make_response(jsonify({"error": "Invalid cursor"}), 400))
+
+def _after(columns, values):
+    #keyset condition for a descending sort: (a, b) < (va, vb)  ->  a < va or (a == va and b < vb).
+    #NULLs come last in a descending sort on mysql/sqlite, so they are "smaller" than any value: rows with a NULL a come
+    #after every non-NULL va, and once the cursor is in the NULLs only the next ids among them are left
+    column, value = columns[0], values[0]
+    if len(columns) == 1:
+        return column < value if value is not None else db.false()
+    rest = _after(columns[1:], values[1:])
+    if value is None:
+        return db.and_(column.is_(None), rest)
+    return db.or_(column < value, db.and_(column == value, rest), column.is_(None))
+
+def paginate(query, *columns):
+    #keyset (cursor) pagination, newest first, on columns like (timestamp, id) where the last one is unique.
+    #each page is a "WHERE (timestamp, id) < cursor ORDER BY timestamp desc, id desc LIMIT n" so it costs the same
+    #however deep in the history we are, unlike OFFSET. returns the items and the cursor of the next page (or None)
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        abort(make_response(jsonify({"error": "limit must be an integer"}), 400))
+    if limit <= 0:
+        abort(make_response(jsonify({"error": "limit must be positive"}), 400))
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        query = query.filter(_after(columns, decode_cursor(cursor, columns)))
+    items = query.order_by(*[c.desc() for c in columns]).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor([getattr(items[-1], c.key) for c in columns])
+    return items, next_cursor
+
+def paginated_response(body, next_cursor):
+    #the body keeps its old shape, the cursor of the next page goes in a header
+    response = jsonify(body)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
@@ -0,0 +1,53 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from extensions import bcrypt
+
+#bcrypt work factor (each +1 doubles the cost of a login) and how many hashes a worker computes at the same time
+BCRYPT_LOG_ROUNDS = 12
+BCRYPT_WORKERS = 2
+
+class PasswordHasher:
+    #bcrypt runs in a small thread pool instead of on the request thread. bcrypt releases the GIL while hashing, so the
+    #other requests of this worker keep running, and a login burst can use at most `workers` cores
+    def __init__(self, log_rounds=BCRYPT_LOG_ROUNDS, workers=BCRYPT_WORKERS):
+        self.log_rounds = log_rounds
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.log_rounds = app.config.get('BCRYPT_LOG_ROUNDS', self.log_rounds)
+        self.workers = app.config.get('BCRYPT_WORKERS', self.workers)
+
+    def _pool(self):
+        #created lazily so every gunicorn worker gets its own threads after the fork
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+            return self._executor
+
+    def hash(self, password):
+        return self._pool().submit(bcrypt.generate_password_hash, password, self.log_rounds).result()
+
+    def check(self, hashed_password, password):
+        return self._pool().submit(bcrypt.check_password_hash, hashed_password, password).result()
+
+    def needs_rehash(self, hashed_password):
+        #a bcrypt hash looks like $2b$<cost>$<salt+hash>, so we know its cost without hashing anything
+        if isinstance(hashed_password, bytes):
+            hashed_password = hashed_password.decode('utf-8')
+        try:
+            return int(hashed_password.split('$')[2]) != self.log_rounds
+        except (IndexError, ValueError):
+            return True
+
+password_hasher = PasswordHasher()
+
+def hash_password(password):
+    return password_hasher.hash(password)
+
+def check_password(hashed_password, password):
+    return password_hasher.check(hashed_password, password)
+
+def needs_rehash(hashed_password):
+    return password_hasher.needs_rehash(hashed_password)
@@ -0,0 +1,117 @@
+from extensions import db
+from model.transaction import Transaction
+import datetime
+import heapq
+import threading
+
+#the time window we usually take for the "current" exchange rate
+RATE_WINDOW_HOURS = 72
+#how often (in seconds) we pick up transactions that other workers inserted
+SYNC_INTERVAL_SECONDS = 2
+#how far back (in seconds) each sync looks again: ids are given out at insert time, so a transaction with a lower id
+#than one we already saw can still commit after our last sync. it is at least as old as its added_date, so anything
+#committed late by less than this is picked up on the next sync
+SYNC_SLACK_SECONDS = 60
+
+class RateEngine:
+    #keeps running sums and counts of the rates inside the rolling window, per direction, both with and
+    #without outliers, so reading the current rate is O(1) instead of loading every transaction in the window
+    def __init__(self, window_hours=RATE_WINDOW_HOURS, sync_interval=SYNC_INTERVAL_SECONDS, sync_slack=SYNC_SLACK_SECONDS):
+        self.window = datetime.timedelta(hours=window_hours)
+        self.sync_interval = datetime.timedelta(seconds=sync_interval)
+        self.sync_slack = datetime.timedelta(seconds=sync_slack)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        #forget everything, the next read reloads the window from the db
+        self._loaded = False
+        self._last_sync = None
+        self._last_id = 0
+        self._heap = []  #(added_date, id, usd_to_lbp, rate, is_outlier), oldest transaction on top
+        self._seen = set()
+        #[count, sum of rates] per direction
+        self._all = {True: [0, 0.0], False: [0, 0.0]}
+        self._clean = {True: [0, 0.0], False: [0, 0.0]}  #same but without the outliers
+
+    def _add(self, txn_id, added_date, usd_to_lbp, rate, is_outlier):
+        if txn_id in self._seen:
+            return
+        self._seen.add(txn_id)
+        heapq.heappush(self._heap, (added_date, txn_id, usd_to_lbp, rate, is_outlier))
+        self._all[usd_to_lbp][0] += 1
+        self._all[usd_to_lbp][1] += rate
+        if not is_outlier:
+            self._clean[usd_to_lbp][0] += 1
+            self._clean[usd_to_lbp][1] += rate
+
+    def _evict(self, cutoff):
+        #drop the transactions that aged out of the window and take them out of the running sums
+        while self._heap and self._heap[0][0] < cutoff:
+            added_date, txn_id, usd_to_lbp, rate, is_outlier = heapq.heappop(self._heap)
+            self._seen.discard(txn_id)
+            totals = [self._all[usd_to_lbp]] if is_outlier else [self._all[usd_to_lbp], self._clean[usd_to_lbp]]
+            for total in totals:
+                total[0] -= 1
+                total[1] = total[1] - rate if total[0] else 0.0  #reset to exactly 0 so float errors dont pile up
+
+    def _sync(self, now):
+        #first call loads the window, later calls only fetch rows with a higher id than what we already saw
+        #(these are the ones inserted by other workers) plus the last sync_slack of rows again, for the lower ids that
+        #committed late. _add skips the ones we already have, so we never rescan the whole window
+        if self._loaded and now - self._last_sync < self.sync_interval:
+            return
+        query = db.session.query(
+            Transaction.id,
+            Transaction.added_date,
+            Transaction.usd_to_lbp,
+            Transaction.lbp_amount,
+            Transaction.usd_amount,
+            Transaction.is_outlier
+        )
+        if self._loaded:
+            query = query.filter(db.or_(
+                Transaction.id > self._last_id,
+                Transaction.added_date >= self._last_sync - self.sync_slack
+            ))
+        rows = query.filter(Transaction.added_date >= now - self.window).all()
+        for row in rows:
+            self._add(row.id, row.added_date, bool(row.usd_to_lbp), row.lbp_amount / row.usd_amount, bool(row.is_outlier))
+            self._last_id = max(self._last_id, row.id)
+        self._loaded = True
+        self._last_sync = now
+
+    def record(self, transaction):
+        #call this after the transaction is committed so the rate is updated right away for this worker
+        with self._lock:
+            if not self._loaded:
+                return  #the first read will load it from the db anyway
+            self._add(
+                transaction.id,
+                transaction.added_date,
+                bool(transaction.usd_to_lbp),
+                transaction.lbp_amount / transaction.usd_amount,
+                bool(transaction.is_outlier)
+            )
+
+    def rate(self, usd_to_lbp, include_outliers=False):
+        now = datetime.datetime.now()
+        with self._lock:
+            self._sync(now)
+            self._evict(now - self.window)
+            count, total = (self._all if include_outliers else self._clean)[bool(usd_to_lbp)]
+        return total / count if count else None
+
+    def window_count(self):
+        #how many transactions are inside the window, both directions and outliers included
+        now = datetime.datetime.now()
+        with self._lock:
+            self._sync(now)
+            self._evict(now - self.window)
+            return self._all[True][0] + self._all[False][0]
+
+    def rates(self, include_outliers=False):
+        #returns (usd_to_lbp average, lbp_to_usd average), None for a direction with no transactions
+        return self.rate(True, include_outliers), self.rate(False, include_outliers)
+
+rate_engine = RateEngine()
@@ -0,0 +1,93 @@
+from flask import request, make_response
+from collections import OrderedDict
+import functools
+import hashlib
+import threading
+import time
+
+#how long (in seconds) a cached response is served at most: other workers dont see this worker's version bumps, so
+#this is how far behind they can be. and how many responses we keep
+RESPONSE_CACHE_TTL = 5
+RESPONSE_CACHE_SIZE = 1000
+
+class ResponseCache:
+    #caches the json body of read-only endpoints that only change when transactions change (current rate, analytics,
+    #history). entries are keyed by endpoint + sorted query args and tagged with a data version: bump() (called after a
+    #transaction is inserted or a backup restored) makes every cached response stale at once. every response carries a
+    #strong ETag (hash of the body) so a client that already has it gets an empty 304
+    def __init__(self, ttl=RESPONSE_CACHE_TTL, size=RESPONSE_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self.version = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  #key -> (version, expires_at, body, mimetype, etag)
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def init_app(self, app):
+        self.ttl = app.config.get('RESPONSE_CACHE_TTL', self.ttl)
+        self.size = app.config.get('RESPONSE_CACHE_SIZE', self.size)
+
+    def bump(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != self.version or entry[1] <= time.time():
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, version, body, mimetype, etag):
+        with self._lock:
+            if version != self.version:
+                return  #the data changed while we were computing it
+            self._entries[key] = (version, time.time() + self.ttl, body, mimetype, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def cached(self, view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (request.endpoint, tuple(sorted(request.args.items(multi=True))))
+            entry = self._get(key)
+            if entry is not None:
+                self.hits += 1
+                _, _, body, mimetype, etag = entry
+            else:
+                self.misses += 1
+                version = self.version
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response  #errors (bad params...) are not cached
+                body, mimetype = response.get_data(), response.mimetype
+                etag = hashlib.sha256(body).hexdigest()[:32]
+                self._put(key, version, body, mimetype, etag)
+
+            response = make_response(body)
+            response.mimetype = mimetype
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'  #the browser can keep it but has to revalidate (-> 304)
+            response = response.make_conditional(request)
+            if response.status_code == 304:
+                self.not_modified += 1
+            return response
+        return wrapper
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "not_modified": self.not_modified
+        }
+
+response_cache = ResponseCache()
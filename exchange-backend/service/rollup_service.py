@@ -0,0 +1,149 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import insert, func, case
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from extensions import db
+from model.rate_rollup import RateRollup
+from model.transaction import Transaction
+
+GRANULARITIES = ['hourly', 'daily']
+
+def get_bucket(transac_dt, granularity):
+    #rounds down a transac to the start of its bucket (hour/day)
+    if granularity == 'hourly':
+        return transac_dt.replace(minute=0, second=0, microsecond=0)
+    else:
+        return transac_dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+#formats of the bucket start computed in sql, so reports can group by time without loading the rows
+BUCKET_FORMAT = "%Y-%m-%d %H:%M:%S"
+SQL_INTERVALS = ['hourly', 'daily', 'weekly']
+
+def sql_bucket(column, interval):
+    #sql expression rounding a datetime column down to the start of its hour/day/week (weeks start on monday), as a
+    #'YYYY-MM-DD HH:MM:SS' string. the functions differ per database, sqlite is what we use locally for quick tests
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        if interval == 'hourly':
+            return func.strftime('%Y-%m-%d %H:00:00', column)
+        if interval == 'daily':
+            return func.strftime('%Y-%m-%d 00:00:00', column)
+        return func.strftime('%Y-%m-%d 00:00:00', column, 'weekday 0', '-6 days')
+    if dialect == 'postgresql':
+        trunc = {'hourly': 'hour', 'daily': 'day', 'weekly': 'week'}[interval]
+        return func.to_char(func.date_trunc(trunc, column), 'YYYY-MM-DD HH24:MI:SS')
+    #mysql
+    if interval == 'hourly':
+        return func.date_format(column, '%Y-%m-%d %H:00:00')
+    if interval == 'daily':
+        return func.date_format(column, '%Y-%m-%d 00:00:00')
+    return func.date_format(func.subdate(column, func.weekday(column)), '%Y-%m-%d 00:00:00')
+
+def _upsert_bucket(session, values):
+    #one INSERT ... ON DUPLICATE KEY UPDATE (ON CONFLICT DO UPDATE on sqlite/postgresql) per bucket: the db creates or
+    #merges the row in a single statement, so two workers hitting a new bucket at once cant deadlock on it the way a
+    #SELECT ... FOR UPDATE of a missing row followed by an insert does on InnoDB
+    dialect = session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite_insert if dialect == 'sqlite' else postgresql_insert)(RateRollup).values(**values)
+        new = stmt.excluded
+        greatest, least = (func.max, func.min) if dialect == 'sqlite' else (func.greatest, func.least)
+        #every expression here sees the row as it was before the update
+        stmt = stmt.on_conflict_do_update(index_elements=['usd_to_lbp', 'granularity', 'bucket_start'], set_={
+            "transaction_count": RateRollup.transaction_count + 1,
+            "rate_sum": RateRollup.rate_sum + new.rate_sum,
+            "high_rate": greatest(RateRollup.high_rate, new.high_rate),
+            "low_rate": least(RateRollup.low_rate, new.low_rate),
+            "open_rate": case((new.first_date < RateRollup.first_date, new.open_rate), else_=RateRollup.open_rate),
+            "first_date": least(RateRollup.first_date, new.first_date),
+            "close_rate": case((new.last_date >= RateRollup.last_date, new.close_rate), else_=RateRollup.close_rate),
+            "last_date": greatest(RateRollup.last_date, new.last_date)
+        })
+    else:
+        #mysql
+        stmt = mysql_insert(RateRollup).values(**values)
+        new = stmt.inserted
+        #mysql applies the assignments left to right and later ones see the new values, so the open/close rates are
+        #set before their dates move
+        stmt = stmt.on_duplicate_key_update([
+            ("transaction_count", RateRollup.transaction_count + 1),
+            ("rate_sum", RateRollup.rate_sum + new.rate_sum),
+            ("high_rate", func.greatest(RateRollup.high_rate, new.high_rate)),
+            ("low_rate", func.least(RateRollup.low_rate, new.low_rate)),
+            ("open_rate", case((new.first_date < RateRollup.first_date, new.open_rate), else_=RateRollup.open_rate)),
+            ("first_date", func.least(RateRollup.first_date, new.first_date)),
+            ("close_rate", case((new.last_date >= RateRollup.last_date, new.close_rate), else_=RateRollup.close_rate)),
+            ("last_date", func.greatest(RateRollup.last_date, new.last_date))
+        ])
+    session.execute(stmt)
+
+def apply_transaction(session, transaction):
+    #add a new transaction to its hourly and daily buckets, the caller commits together with the transaction itself
+    rate = transaction.lbp_amount / transaction.usd_amount
+    for granularity in GRANULARITIES:
+        _upsert_bucket(session, {
+            "usd_to_lbp": transaction.usd_to_lbp,
+            "granularity": granularity,
+            "bucket_start": get_bucket(transaction.added_date, granularity),
+            "transaction_count": 1,
+            "rate_sum": rate,
+            "open_rate": rate,
+            "high_rate": rate,
+            "low_rate": rate,
+            "close_rate": rate,
+            "first_date": transaction.added_date,
+            "last_date": transaction.added_date
+        })
+
+def rebuild_rollups(session, batch_size=5000):
+    #recompute every bucket from the raw transactions, streaming them so only the buckets are kept in memory
+    buckets = {}
+    rows = session.query(
+        Transaction.usd_to_lbp,
+        Transaction.added_date,
+        Transaction.lbp_amount,
+        Transaction.usd_amount
+    ).filter(Transaction.added_date != None).order_by(Transaction.added_date, Transaction.id).yield_per(batch_size)
+    for row in rows:
+        rate = row.lbp_amount / row.usd_amount
+        for granularity in GRANULARITIES:
+            key = (bool(row.usd_to_lbp), granularity, get_bucket(row.added_date, granularity))
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = {
+                    "usd_to_lbp": key[0],
+                    "granularity": granularity,
+                    "bucket_start": key[2],
+                    "transaction_count": 1,
+                    "rate_sum": rate,
+                    "open_rate": rate,
+                    "high_rate": rate,
+                    "low_rate": rate,
+                    "close_rate": rate,
+                    "first_date": row.added_date,
+                    "last_date": row.added_date
+                }
+                continue
+            #rows come ordered by date, so the open never changes and the close is always the latest one
+            bucket["transaction_count"] += 1
+            bucket["rate_sum"] += rate
+            bucket["high_rate"] = max(bucket["high_rate"], rate)
+            bucket["low_rate"] = min(bucket["low_rate"], rate)
+            bucket["close_rate"] = rate
+            bucket["last_date"] = row.added_date
+
+    session.query(RateRollup).delete()
+    rollups = list(buckets.values())
+    for i in range(0, len(rollups), batch_size):
+        session.execute(insert(RateRollup), rollups[i:i + batch_size])
+    return len(rollups)
+
+#backfill command: flask --app app rebuild-rollups
+@click.command('rebuild-rollups')
+@with_appcontext
+def rebuild_rollups_command():
+    count = rebuild_rollups(db.session)
+    db.session.commit()
+    click.echo(f"Rebuilt {count} rate rollup buckets")
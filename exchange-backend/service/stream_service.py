@@ -0,0 +1,9 @@
+import zlib
+
+def gzip_stream(chunks):
+    #compress a stream of text chunks on the fly (wbits=31 gives a gzip header), with a sync flush after each chunk
+    #so the client can decompress while it downloads
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        yield compressor.compress(chunk.encode('utf-8')) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
@@ -42,14 +42,15 @@ export default function Login({onLogin}) {
       } else if (response.status === 400) {
         setError("Username and password are required.");
       } else if (response.ok) {
-        // fetch user info to get role
-        const userResponse = await fetch(`${BASE_URL}/admin/users`, {
+        // fetch our own profile to get the role
+        const userResponse = await fetch(`${BASE_URL}/me`, {
           headers: { Authorization: `Bearer ${data.token}` },
         });
 
         let role = "USER";
         if (userResponse.ok) {
-          role = "ADMIN";
+          const me = await userResponse.json();
+          role = me.role;
         }
 
         onLogin(data.token, role);
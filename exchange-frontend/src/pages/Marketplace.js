@@ -120,7 +120,7 @@ export default function Marketplace({ userToken }) {
         setError("Too many requests. Please wait and try again.");
         setCooldown(true);
         setTimeout(() => setCooldown(false), 30000);
-      } else if (response.status === 400) {
+      } else if (response.status === 400 || response.status === 409) {
         setError(data.error || "Offer is no longer available.");
         fetchOffers(); // refresh to show updated status
       } else if (response.status === 401) {